@@ -0,0 +1,203 @@
+"""
+Benchmark harness for every human x teacher x evaluator combination.
+
+    python bench.py run [--out results.json] [--datasets 'benchmark/*.csv'] [-H H_PL7] [-T T_PL7] [-E E_MSE]
+    python bench.py compare baseline.json results.json [--time-tolerance 1.5] [--quality-tolerance 1e-6]
+    python bench.py sweep [--out sweep.json] [--sizes 100,1000,10000,100000] [--max-seconds 30]
+
+run times each cell of the grid on the benchmark/ shapes (scaled to [0, 1] like
+the notebooks) and records wall time, evaluator calls (full, incremental and coarse),
+peak traced memory (with --memory), the evaluator's distance for the returned
+sample and a status.
+compare matches two result files cell by cell and exits 1 if any cell got slower
+or worse. sweep resamples each shape to growing sizes and times every teacher on
+them. A teacher stops growing once it overruns --max-seconds, at which point it
+is cancelled through its progress reports.
+"""
+import argparse
+import functools
+import glob
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import legoBlocks
+import pipeline
+from legoBlocks import Cancelled, Pipeline, progress_scope
+
+def load_benchmark(path):
+    d = np.loadtxt(path, delimiter=',', ndmin=2)
+    x, y = d[:, 0], d[:, 1]
+    x = (x - x.min()) / (x.max() - x.min())
+    y = (y - y.min()) / (y.max() - y.min())
+    return {'x': x, 'y': y, 'name': os.path.basename(path)}
+
+def resample(D, size, seed=0):
+    # the shape of D on `size` evenly spaced points, with 1% noise so no sample fits exactly
+    x = np.linspace(D['x'].min(), D['x'].max(), size)
+    y = np.interp(x, D['x'], D['y'])
+    y = y + np.random.default_rng(seed).normal(0, 0.01 * (y.max() - y.min() or 1), size)
+    return {'x': x, 'y': y, 'name': f"{D['name']}@{size}"}
+
+class CountingEvaluator:
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.calls = 0
+        self.incremental_calls = 0
+        self.coarse_calls = 0
+        functools.update_wrapper(self, evaluator, updated=())
+        if hasattr(evaluator, 'incremental'):
+            self.incremental = self._incremental
+        if hasattr(evaluator, 'coarse'):
+            self.coarse = self._coarse
+        if hasattr(evaluator, 'batch'):
+            self.batch = self._batch
+
+    def __call__(self, D, model):
+        self.calls += 1
+        return self.evaluator(D, model)
+
+    def _incremental(self, D, stats):
+        self.incremental_calls += 1
+        return self.evaluator.incremental(D, stats)
+
+    def _coarse(self, D, stats):
+        self.coarse_calls += 1
+        return self.evaluator.coarse(D, stats)
+
+    def _batch(self, D, predicted):
+        # a batch counts one call per candidate
+        self.calls += len(predicted)
+        return self.evaluator.batch(D, predicted)
+
+def run_cell(D, human, teacher, evaluator, max_seconds=None, memory=False):
+    H, T, E = (getattr(legoBlocks, name) for name in (human, teacher, evaluator))
+    counted = CountingEvaluator(E)
+    params = {'seed': 0} if 'seed' in inspect.signature(T).parameters else {}
+    p = Pipeline(H, T, counted, **params)
+    deadline = time.perf_counter() + max_seconds if max_seconds else None
+
+    def watchdog(**_):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise Cancelled()
+
+    cell = {'dataset': D['name'], 'n': len(D['x']), 'human': human, 'teacher': teacher, 'evaluator': evaluator}
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with progress_scope(watchdog):
+            sample, _ = p.generate_sample(D)
+        cell['status'] = 'ok'
+    except Cancelled:
+        sample = None
+        cell['status'] = 'timeout'
+    except Exception as e:
+        sample = None
+        cell['status'] = 'error: %s' % e
+    cell['seconds'] = time.perf_counter() - start
+    if memory:
+        cell['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    cell['evaluator_calls'] = counted.calls
+    cell['incremental_calls'] = counted.incremental_calls
+    cell['coarse_calls'] = counted.coarse_calls
+    cell['distance'] = float(E(D, H(sample[0], sample[1]))) if sample is not None and sample[0] is not None else None
+    return cell
+
+def meta():
+    return {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def grid(args):
+    return [(h, t, e) for h in args.humans for t in args.teachers for e in args.evaluators]
+
+def cmd_run(args):
+    DD = [load_benchmark(f) for f in sorted(glob.glob(args.datasets))]
+    cells = []
+    for D in DD:
+        for human, teacher, evaluator in grid(args):
+            cell = run_cell(D, human, teacher, evaluator, args.max_seconds, args.memory)
+            cells.append(cell)
+            print(f"{D['name']:<16}{human:<8}{teacher:<24}{evaluator:<15}{cell['seconds']:>9.4f}s "
+                  f"{cell['evaluator_calls']:>8} {cell['incremental_calls']:>8}  {cell['distance']}  {cell['status']}")
+    write(args.out, {'meta': meta(), 'cells': cells})
+
+def cmd_sweep(args):
+    DD = [load_benchmark(f) for f in sorted(glob.glob(args.datasets))]
+    sizes = [int(s) for s in args.sizes.split(',')]
+    cells = []
+    for human, teacher, evaluator in grid(args):
+        for D in DD:
+            for size in sizes:
+                cell = run_cell(resample(D, size), human, teacher, evaluator, args.max_seconds, args.memory)
+                cells.append(cell)
+                print(f"{cell['dataset']:<22}{human:<8}{teacher:<24}{evaluator:<15}{cell['seconds']:>9.4f}s  {cell['status']}")
+                if cell['status'] != 'ok':
+                    break
+    write(args.out, {'meta': meta(), 'cells': cells})
+
+def cell_key(cell):
+    return (cell['dataset'], cell['n'], cell['human'], cell['teacher'], cell['evaluator'])
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = {cell_key(c): c for c in json.load(f)['cells']}
+    with open(args.current) as f:
+        current = json.load(f)['cells']
+    regressions = 0
+    for cell in current:
+        base = baseline.get(cell_key(cell))
+        if base is None:
+            continue
+        problems = []
+        if cell['status'] != 'ok' and base['status'] == 'ok':
+            problems.append(cell['status'])
+        slower = cell['seconds'] - base['seconds']
+        if slower > args.min_seconds and cell['seconds'] > base['seconds'] * args.time_tolerance:
+            problems.append('slower %.4fs -> %.4fs' % (base['seconds'], cell['seconds']))
+        if base['distance'] is not None and cell['distance'] is not None and \
+                cell['distance'] > base['distance'] + args.quality_tolerance * max(abs(base['distance']), 1e-12):
+            problems.append('worse %.6g -> %.6g' % (base['distance'], cell['distance']))
+        if problems:
+            regressions += 1
+            print('%s %s %s %s: %s' % (cell['dataset'], cell['human'], cell['teacher'], cell['evaluator'], '; '.join(problems)))
+    print('%d regression(s) in %d cells' % (regressions, len(current)))
+    return 1 if regressions else 0
+
+def write(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('wrote %s' % path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, out, max_seconds in (('run', 'bench_results.json', None), ('sweep', 'bench_sweep.json', 30.0)):
+        p = commands.add_parser(name)
+        p.add_argument('--out', default=out)
+        p.add_argument('--datasets', default='benchmark/*.csv')
+        p.add_argument('-H', '--humans', nargs='+', default=pipeline.humans)
+        p.add_argument('-T', '--teachers', nargs='+', default=pipeline.teachers)
+        p.add_argument('-E', '--evaluators', nargs='+', default=pipeline.evaluators)
+        p.add_argument('--max-seconds', type=float, default=max_seconds, help='cancel a cell after this long')
+        p.add_argument('--memory', action='store_true', help='record peak memory with tracemalloc')
+        if name == 'sweep':
+            p.add_argument('--sizes', default='100,1000,10000,100000')
+    p = commands.add_parser('compare')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--time-tolerance', type=float, default=1.5, help='flag cells slower than baseline x this')
+    p.add_argument('--min-seconds', type=float, default=0.01, help='ignore slowdowns smaller than this')
+    p.add_argument('--quality-tolerance', type=float, default=1e-6, help='flag distances worse by this fraction')
+    args = parser.parse_args(argv)
+    return {'run': cmd_run, 'sweep': cmd_sweep, 'compare': cmd_compare}[args.command](args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Times importing the app's modules and fitting the NumPy least squares humans, and
+checks H_OLS/H_quad predict like the scikit-learn models they replace when
+scikit-learn is installed (it is only needed for this check). The check uses x
+in [0, 1]: on year-scale x H_quad rescales x and no longer truncates the fit
+the way LinearRegression does (see legoBlocks.py).
+
+usage: python bench_humans.py
+"""
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from legoBlocks import H_OLS, H_quad
+
+try:
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import PolynomialFeatures
+except ImportError:
+    LinearRegression = None
+
+class H_OLS_reference:
+    def __init__(self, x, y):
+        self.model = LinearRegression().fit(np.array(x).reshape(-1, 1), y)
+
+    def predict(self, x):
+        return self.model.predict(np.array(x).reshape(-1, 1))
+
+class H_quad_reference:
+    def __init__(self, x, y):
+        self.poly = PolynomialFeatures(degree=2, include_bias=False)
+        self.model = LinearRegression().fit(self.poly.fit_transform(np.array(x).reshape(-1, 1)), y)
+
+    def predict(self, x):
+        return self.model.predict(self.poly.fit_transform(np.array(x).reshape(-1, 1)))
+
+def import_seconds(module, repeat=3):
+    # in a fresh interpreter, best of `repeat`
+    code = 'import time; t = time.perf_counter(); import %s; print(time.perf_counter() - t)' % module
+    return min(float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+               for _ in range(repeat))
+
+def per_call(f, repeat=1000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+if __name__ == '__main__':
+    modules = ['legoBlocks', 'pipeline', 'matplotlib.pyplot', 'sklearn.linear_model']
+    for module in modules:
+        try:
+            print(f"import {module:<22}{import_seconds(module):>9.3f}s")
+        except subprocess.CalledProcessError:
+            print(f"import {module:<22}{'missing':>10}")
+
+    rng = np.random.default_rng(0)
+    grid = np.linspace(0, 1, 1000)
+    pairs = [(H_OLS, H_OLS_reference), (H_quad, H_quad_reference)]
+    print(f"\n{'human':<8}{'points':>7}{'fit':>10}{'predict':>10}{'reference fit':>15}{'predict':>10}  max difference")
+    for H, reference in pairs:
+        for k in (2, 3, 1000):
+            x, y = np.sort(rng.random(k)), rng.random(k)
+            model = H(x, y)
+            row = f"{H.__name__:<8}{k:>7}{per_call(lambda: H(x, y)) * 1e6:>8.1f}us{per_call(lambda: model.predict(grid)) * 1e6:>8.1f}us"
+            if LinearRegression is not None:
+                ref = reference(x, y)
+                row += f"{per_call(lambda: reference(x, y)) * 1e6:>13.1f}us{per_call(lambda: ref.predict(grid)) * 1e6:>8.1f}us"
+                row += f"  {np.abs(model.predict(grid) - ref.predict(grid)).max():.2e}"
+            print(row)
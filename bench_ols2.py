@@ -0,0 +1,60 @@
+"""
+Times the closed-form T_OLS2 against the original pair-by-pair scikit-learn search
+on every series in benchmark/ and data/, and checks both return the same sample.
+
+usage: python bench_ols2.py
+"""
+import glob
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error
+
+from legoBlocks import T_OLS2, H_OLS, E_MSE
+
+def T_OLS2_reference(D, H, evaluator):
+    x = D['x'].reshape(-1, 1)
+    y = D['y']
+    minDist = math.inf
+    minS = [[],[]]
+    h_tilde = LinearRegression()
+    for i in range(len(x)):
+        for j in range(i+1, len(x)):
+            x_sample = np.array([x[i], x[j]]).reshape(-1, 1)
+            y_sample = np.array([y[i], y[j]])
+            h_tilde.fit(x_sample, y_sample)
+            y_predicted = h_tilde.predict(x)
+            distance = mean_squared_error(y, y_predicted)
+            if (distance < minDist):
+                minDist = distance
+                minS[0] = x_sample
+                minS[1] = y_sample
+    return minS, minDist
+
+def load(f, header):
+    d = pd.read_csv(f, header=header)
+    return {'x': d.iloc[:,0].to_numpy(), 'y': d.iloc[:,1].to_numpy(), 'name': os.path.basename(f)}
+
+def timed(T, D):
+    start = time.perf_counter()
+    result = T(D, H_OLS, E_MSE)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    DD = [load(f, None) for f in sorted(glob.glob('benchmark/*.csv'))]
+    DD += [load(f, 0) for f in sorted(glob.glob('data/*.csv'))]
+    print(f"{'dataset':<24}{'n':>6}{'reference':>12}{'closed-form':>13}{'speedup':>10}  same")
+    total_ref = total_new = 0
+    for D in DD:
+        (s_ref, d_ref), t_ref = timed(T_OLS2_reference, D)
+        (s_new, d_new), t_new = timed(T_OLS2, D)
+        same = np.array_equal(s_ref[0], s_new[0]) and np.array_equal(s_ref[1], s_new[1]) \
+            and math.isclose(d_ref, d_new, rel_tol=1e-9, abs_tol=1e-12)
+        total_ref += t_ref
+        total_new += t_new
+        print(f"{D['name']:<24}{len(D['x']):>6}{t_ref:>11.4f}s{t_new:>12.4f}s{t_ref / t_new:>9.1f}x  {same}")
+    print(f"{'total':<30}{total_ref:>11.4f}s{total_new:>12.4f}s{total_ref / total_new:>9.1f}x")
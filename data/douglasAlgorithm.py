@@ -1,74 +1,27 @@
 from pandas import *
 import csv
-import math
- 
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from legoBlocks import douglas_peucker
+
 STIMULINAME = "s4";
 XCOL = "Year";
 YCOL = "GDP per capita";
-
-def PerpendicularDistance(p0, p1, p2):
-    a = (p1[1]-p0[1])/(p1[0]-p0[0])
-    b = -1
-    c = p0[1] - a * p0[0]
-
-    return math.fabs((a * p2[0] + b * p2[1] + c)) / (math.sqrt(a * a + b * b));
-
-def DouglasPeucker(PointList, epsilon):
-    # Find the point with the maximum distance
-    dmax = 0
-    index = 0
-    end = len(PointList)-1
-    for i in range(1, end): 
-        d = PerpendicularDistance(PointList[i], PointList[0], PointList[end]) 
-        if (d > dmax):
-            index = i
-            dmax = d
-
-    ResultList = []
-
-    # If max distance is greater than epsilon, recursively simplify
-    if (dmax > epsilon):
-        # Recursive call
-        recResults1 = DouglasPeucker(PointList[:(index+1)], epsilon)
-        recResults2 = DouglasPeucker(PointList[index:], epsilon)
-
-        # Build the result list
-        ResultList = recResults1[:(len(recResults1)-1)] + recResults2
-    else:
-        ResultList = [PointList[0], PointList[end]]
-    # Return the result
-    return ResultList
+RATIO = 0.5
 
 # reading CSV file
 data = read_csv(STIMULINAME + ".csv")
- 
-# converting column data to list
-xValues = data[XCOL].tolist()
-yValues = data[YCOL].tolist()
-dataList = tuple(zip(xValues, yValues)) 
-
-epsilon = 10
-epsilon_dict = set()
-epsilon_dict.add(epsilon)
-lr = 1;
 
-sampledList = DouglasPeucker(dataList, epsilon)
-compressionRate = len(sampledList) / len(dataList)
-
-while (compressionRate <= 0.48 or 0.52 <= compressionRate):
-    if (compressionRate <= 0.48):
-        epsilon -= lr;
-    else:
-        epsilon += lr;
-    sampledList = DouglasPeucker(dataList, epsilon)
-    compressionRate = len(sampledList) / len(dataList)
-    if epsilon in epsilon_dict:
-        lr /= 10
-    else:
-        epsilon_dict.add(epsilon)
-    print('epsilon: ' + str(epsilon))
-    print('compressionRate:' + str(compressionRate))
+# converting column data to arrays
+xValues = data[XCOL].to_numpy()
+yValues = data[YCOL].to_numpy()
 
+# keeps round(RATIO * n) points; thresholds are computed once, no epsilon search
+index = douglas_peucker(xValues, yValues, ratio=RATIO)
+sampledList = list(zip(xValues[index].tolist(), yValues[index].tolist()))
+print('compressionRate:' + str(len(sampledList) / len(xValues)))
 print(sampledList)
 
 with open(STIMULINAME + '-sampled.csv','w') as out:
@@ -76,4 +29,3 @@ with open(STIMULINAME + '-sampled.csv','w') as out:
     csv_out.writerow([XCOL, YCOL])
     for row in sampledList:
         csv_out.writerow(row)
-
@@ -0,0 +1,98 @@
+"""
+Dataset registry: datasets.json and the parsed series under data/.
+
+datasets.json is read once and again only when its mtime changes. Each CSV is
+parsed with NumPy (no pandas) into one contiguous float64 (2, n) array, saved as
+an .npy under ARRAY_DIR keyed by the sha256 of the CSV, and memory-mapped from
+there on, so a series is parsed once per content and later requests read the
+shared pages without copying. Editing the CSV changes its hash (recomputed only
+when its mtime or size changes), which retires the old array. The first line of
+a CSV is skipped when it is a header, i.e. not two numbers.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from memoStore import MemoStore, memo_key
+from resultCache import file_digest
+
+DATA_DIR = 'data'
+REGISTRY_FILE = 'datasets.json'
+ARRAY_DIR = os.path.join('storage', 'arrays')
+ARRAY_BYTES = 1 << 30
+
+def parse_csv(path):
+    with open(path) as f:
+        first = f.readline()
+    try:
+        [float(v) for v in first.split(',')[:2]]
+        header = 0
+    except ValueError:
+        header = 1
+    xy = np.loadtxt(path, delimiter=',', skiprows=header, usecols=(0, 1), dtype=np.float64, ndmin=2)
+    return np.ascontiguousarray(xy.T)
+
+class DatasetRegistry:
+    def __init__(self, data_dir=DATA_DIR, registry_file=REGISTRY_FILE, store=None):
+        self.data_dir = data_dir
+        self.registry_file = registry_file
+        self.store = store if store is not None else MemoStore(ARRAY_DIR, ARRAY_BYTES)
+        self.lock = threading.Lock()
+        self.registry = None
+        self.stamp = None
+        self.arrays = {}  # filename -> (csv digest, mapped (2, n) array)
+
+    @property
+    def datasets(self):
+        stamp = os.stat(self.registry_file).st_mtime_ns
+        with self.lock:
+            if stamp != self.stamp:
+                with open(self.registry_file) as f:
+                    self.registry = json.load(f)
+                self.stamp = stamp
+            return self.registry['datasets']
+
+    def path(self, filename):
+        f = os.path.join(self.data_dir, filename)
+        if os.path.basename(filename) != filename or not (os.path.isfile(f) and f.endswith('.csv')):
+            raise Exception("Invalid filename")
+        return f
+
+    def digest(self, filename):
+        return file_digest(self.path(filename))
+
+    def _stored(self, f, digest):
+        key = memo_key('dataset', digest)
+        xy = self.store.get(key)
+        if xy is None:
+            self.store.put(key, parse_csv(f))
+            xy = self.store.get(key)
+        return key, xy
+
+    def array(self, filename):
+        f = self.path(filename)
+        digest = file_digest(f)
+        cached = self.arrays.get(filename)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        _, xy = self._stored(f, digest)
+        with self.lock:
+            self.arrays[filename] = (digest, xy)
+        return xy
+
+    def array_path(self, filename):
+        # the .npy backing the series, e.g. to send as is
+        f = self.path(filename)
+        key, _ = self._stored(f, file_digest(f))
+        return self.store.path(key)
+
+    def load(self, filename):
+        xy = self.array(filename)
+        return {'x': xy[0], 'y': xy[1], 'name': filename}
+
+    def preload(self):
+        # parse every registered series up front, e.g. when a server starts
+        for dataset in self.datasets:
+            self.array(dataset['true_values'])
@@ -1,20 +1,25 @@
-from flask import Flask, redirect, url_for, render_template, send_file, request, jsonify
+from flask import Flask, redirect, url_for, render_template, send_file, request, jsonify, Response
 import json
+import itertools
+import os
 from legoBlocks import *
 import pipeline
+from jobs import JobManager, QueueFull
+from resultEncoding import compress
 
 app = Flask(__name__)
 
 @app.route('/')
 def index():
-   # Opening JSON file
-   with open('datasets.json') as json_file:
-      data = json.load(json_file)
-      return render_template('index.html', datasets=data['datasets'], humans=pipeline.humans, teachers=pipeline.teachers, evaluators=pipeline.evaluators)
+   return render_template('index.html', datasets=pipeline.registry.datasets, humans=pipeline.humans, teachers=pipeline.teachers, evaluators=pipeline.evaluators)
 
+# the CSV as uploaded, or with ?format=npy the parsed (2, n) float64 array; both are sent straight from the file
 @app.route('/data/<filename>', methods = ['GET'])
 def getData(filename):
    try:
+      if request.args.get('format') == 'npy':
+         return send_file(pipeline.registry.array_path(filename), mimetype='application/octet-stream',
+                          download_name=filename[:-len('.csv')] + '.npy')
       return send_file('data/%s' % filename)
    except Exception as e:
       return str(e)
@@ -26,18 +31,179 @@ def getUserData(filename):
    except Exception as e:
       return str(e)
 
+# optional teacher options from the query string, e.g. &workers=4&restarts=200&seed=1, &budget=0.5 for T_Auto
+# or &ratio=0.5 for T_DouglasPeucker, &coarse=512 for T_Pyramid, &width=16&size=7 for T_BeamSearch,
+# &k=5 or &distance=0.01 for T_Ladder
+def atLeastOne(value):
+   value = int(value)
+   if value < 1:
+      raise ValueError(f"Invalid teacher parameter: {value} < 1")
+   return value
+
+# processes one request may start (T_HillClimbingRestart's workers); serve.py lowers it to its
+# per-worker concurrency, since the request holds one slot
+MAX_PROCESSES = os.cpu_count() or 1
+
+def processes(value):
+   return min(atLeastOne(value), MAX_PROCESSES)
+
+TEACHER_PARAMS = {'workers': processes, 'restarts': atLeastOne, 'seed': int, 'target': float, 'time_budget': float, 'budget': float,
+                  'k': int, 'ratio': float, 'epsilon': float, 'coarse': int, 'width': int, 'size': int,
+                  'distance': float}
+
+def teacherParams(args):
+   return {k: cast(args[k]) for k, cast in TEACHER_PARAMS.items() if k in args}
+
+# result encoding: &format=base64|msgpack packs the arrays as raw bytes, &omit=x drops fields the client has,
+# &pixels=<chart height> quantizes the prediction (see resultEncoding.py)
+def responseOptions(args):
+   omit = tuple(f for f in args.get('omit', '').split(',') if f)
+   pixels = int(args['pixels']) if 'pixels' in args else None
+   return args.get('format', 'json'), omit, pixels
+
+# gzip or brotli, as the client accepts
+def encodedResponse(body, mimetype):
+   body, encoding = compress(body, request.headers.get('Accept-Encoding', ''))
+   response = Response(body, mimetype=mimetype)
+   response.headers['Vary'] = 'Accept-Encoding'
+   if encoding:
+      response.headers['Content-Encoding'] = encoding
+   return response
+
+# &profile=1 adds counts and timings per component to the result (uncached run);
+# &profile=collapsed returns collapsed stacks for flamegraph.pl or speedscope instead
 @app.route('/pipeline', methods = ['GET'])
 def generateSample():
    data = request.args.get('data')
    human = request.args.get('h')
    teacher = request.args.get('t')
    evaluator = request.args.get('e')
-   print(f"running: {data}, {human}, {teacher}, {evaluator}")
+   profile = request.args.get('profile')
+   try:
+      params = teacherParams(request.args)
+      print(f"running: {data}, {human}, {teacher}, {evaluator}, {params}")
+      if profile:
+         response, stats = pipeline.run_profiled(data, human, teacher, evaluator, params)
+         if profile == 'collapsed':
+            return Response('\n'.join(stats.collapsed()) + '\n', mimetype='text/plain')
+         return response
+      fmt, omit, pixels = responseOptions(request.args)
+      body, mimetype = pipeline.run_encoded(data, human, teacher, evaluator, params, fmt, omit, pixels)
+      return encodedResponse(body, mimetype)
+   except Cancelled as e:
+      # past the deadline serve.py sets for the request
+      return jsonify({'error': str(e) or 'Cancelled'}), 504
+   except Exception as e:
+      print(e)
+      return jsonify({'error': str(e)}), 400
+
+# Server-Sent Events: 'update' whenever the teacher improves, then 'done'; closing the stream stops the teacher
+@app.route('/pipeline/stream', methods = ['GET'])
+def streamSample():
+   data = request.args.get('data')
+   human = request.args.get('h')
+   teacher = request.args.get('t')
+   evaluator = request.args.get('e')
    try:
-      response = pipeline.run(data, human, teacher, evaluator)
-      return response
+      params = teacherParams(request.args)
+      updates = pipeline.run_stream(data, human, teacher, evaluator, params)
+      first = next(updates)
    except Exception as e:
       print(e)
+      return jsonify({'error': str(e)}), 400
+   def events():
+      try:
+         for event, body in itertools.chain([first], updates):
+            yield f"event: {event}\ndata: {body}\n\n"
+      except Exception as e:
+         yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+      finally:
+         updates.close()
+   return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+# many pipelines in one request: POST {"configs": [{"data": ..., "h": ..., "t": ..., "e": ..., teacher params}], "workers": 4};
+# results stream back as newline-delimited JSON in the order they finish (see pipeline.run_batch).
+# serve.py lowers BATCH_MAX_WORKERS to its per-worker concurrency, since a batch holds one slot
+BATCH_MAX_WORKERS = 8
+
+@app.route('/pipeline/batch', methods = ['POST'])
+def batchSample():
+   body = request.get_json(force=True, silent=True) or {}
+   try:
+      configs = [{'data': c.get('data'), 'h': c.get('h'), 't': c.get('t'), 'e': c.get('e'), 'params': teacherParams(c)}
+                 for c in body.get('configs', [])]
+      workers = min(int(body.get('workers', pipeline.BATCH_WORKERS)), BATCH_MAX_WORKERS)
+   except Exception as e:
+      return jsonify({'error': str(e)}), 400
+   lines = pipeline.run_batch(configs, workers)
+   def stream():
+      try:
+         for line in lines:
+            yield line + '\n'
+      finally:
+         lines.close()
+   return Response(stream(), mimetype='application/x-ndjson')
+
+# long-running pipelines: POST a spec, then poll /jobs/<id> or stream /jobs/<id>/events.
+# Jobs live in the process that accepted them, so serve.py sets jobManager to None when it
+# forks more than one worker, and the job routes answer 501
+jobManager = JobManager(pipeline.run)
+
+def jobsDisabled():
+   return jsonify({'error': 'Jobs need a single server process (serve.py --workers 1)'}), 501
+
+@app.route('/jobs', methods = ['POST'])
+def submitJob():
+   if jobManager is None:
+      return jobsDisabled()
+   body = request.get_json(force=True, silent=True) or {}
+   try:
+      params = teacherParams(body)
+   except Exception as e:
+      return jsonify({'error': str(e)}), 400
+   spec = {'data': body.get('data'), 'h': body.get('h'), 't': body.get('t'), 'e': body.get('e'), 'params': params}
+   if not (spec['h'] in pipeline.humans and spec['t'] in pipeline.teachers and spec['e'] in pipeline.evaluators):
+      return jsonify({'error': 'Invalid pipeline component'}), 400
+   try:
+      job = jobManager.submit(spec)
+   except QueueFull as e:
+      return jsonify({'error': str(e)}), 503
+   return jsonify(job.snapshot(result=False)), 202
+
+@app.route('/jobs/<job_id>', methods = ['GET'])
+def getJob(job_id):
+   if jobManager is None:
+      return jobsDisabled()
+   job = jobManager.get(job_id)
+   if job is None:
+      return jsonify({'error': 'Unknown job'}), 404
+   return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>', methods = ['DELETE'])
+def cancelJob(job_id):
+   if jobManager is None:
+      return jobsDisabled()
+   job = jobManager.cancel(job_id)
+   if job is None:
+      return jsonify({'error': 'Unknown job'}), 404
+   return jsonify(job.snapshot(result=False))
+
+@app.route('/jobs/<job_id>/events', methods = ['GET'])
+def streamJob(job_id):
+   if jobManager is None:
+      return jobsDisabled()
+   job = jobManager.get(job_id)
+   if job is None:
+      return jsonify({'error': 'Unknown job'}), 404
+   def events():
+      version = -1
+      while True:
+         version = job.wait(version, timeout=15)
+         finished = job.is_finished
+         yield f"data: {json.dumps(job.snapshot(result=finished))}\n\n"
+         if finished:
+            break
+   return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 @app.route('/favicon.ico', methods = ['GET'])
@@ -45,5 +211,6 @@ def getFavicon():
    return send_file('static/favicon_io/favicon.ico')
 
 if __name__ == '__main__':
+   pipeline.registry.preload()
    app.debug = True
    app.run()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Background jobs for long-running pipelines.
+
+A job is a pipeline spec (dataset, human, teacher, evaluator, teacher params)
+run on a bounded thread pool. While it runs, the teacher's report_progress()
+calls update the job's best distance, iteration count and ETA; cancelling a job
+makes the next report raise Cancelled inside the teacher. Submitting a spec that
+is already queued or running returns the existing job instead of starting a
+second one, and submissions beyond MAX_QUEUED waiting jobs are refused.
+"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from legoBlocks import Cancelled, progress_scope
+
+WORKERS = 2
+MAX_QUEUED = 16
+KEEP_FINISHED = 256
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, spec):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.status = 'queued'
+        self.best = None
+        self.iterations = 0
+        self.done = None
+        self.total = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0  # bumped on every change, for waiters
+        self.cancelled = threading.Event()
+        self.changed = threading.Condition()
+
+    def _update(self, **fields):
+        with self.changed:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+            self.changed.notify_all()
+
+    def progress(self, distance=None, sample=None, done=None, total=None):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        fields = {'iterations': self.iterations + 1}
+        if distance is not None and (self.best is None or distance < self.best):
+            fields['best'] = float(distance)
+        if done is not None:
+            fields['done'] = done
+            fields['total'] = total
+        self._update(**fields)
+
+    def eta(self):
+        if self.status != 'running' or not self.done or not self.total:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed * (self.total - self.done) / self.done
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def snapshot(self, result=True):
+        state = {'id': self.id, 'status': self.status, 'spec': self.spec, 'best': self.best,
+                 'iterations': self.iterations, 'done': self.done, 'total': self.total, 'eta': self.eta(),
+                 'elapsed': (self.finished or time.time()) - self.started if self.started else None}
+        if self.error is not None:
+            state['error'] = self.error
+        if result and self.result is not None:
+            state['result'] = json.loads(self.result)
+        return state
+
+    def wait(self, version, timeout=None):
+        # block until the job changes past `version` or finishes; returns the current version
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version or self.is_finished, timeout)
+            return self.version
+
+class JobManager:
+    """
+    run: function(data, human, teacher, evaluator, params) returning the serialized result
+    """
+    def __init__(self, run, workers=WORKERS, max_queued=MAX_QUEUED):
+        self.run = run
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def spec_key(spec):
+        return json.dumps(spec, sort_keys=True)
+
+    def submit(self, spec):
+        key = self.spec_key(spec)
+        with self.lock:
+            job = self.inflight.get(key)
+            if job is not None:
+                return job
+            if sum(j.status == 'queued' for j in self.inflight.values()) >= self.max_queued:
+                raise QueueFull("Too many queued jobs")
+            job = Job(spec)
+            self.jobs[job.id] = job
+            self.inflight[key] = job
+            self._trim()
+            job.future = self.executor.submit(self._run, job, key)
+        return job
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in itertools.islice(finished, max(0, len(finished) - KEEP_FINISHED)):
+            del self.jobs[job_id]
+
+    def _run(self, job, key):
+        try:
+            if job.cancelled.is_set():
+                job._update(status='cancelled', finished=time.time())
+                return
+            job._update(status='running', started=time.time())
+            spec = job.spec
+            with progress_scope(job.progress):
+                result = self.run(spec['data'], spec['h'], spec['t'], spec['e'], spec.get('params'))
+            job._update(status='done', result=result, finished=time.time())
+        except Cancelled:
+            job._update(status='cancelled', finished=time.time())
+        except Exception as e:
+            job._update(status='failed', error=str(e), finished=time.time())
+        finally:
+            with self.lock:
+                if self.inflight.get(key) is job:
+                    del self.inflight[key]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancelled.set()
+        if job.status == 'queued' and job.future.cancel():
+            job._update(status='cancelled', finished=time.time())
+            with self.lock:
+                key = self.spec_key(job.spec)
+                if self.inflight.get(key) is job:
+                    del self.inflight[key]
+        return job
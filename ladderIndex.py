@@ -0,0 +1,84 @@
+"""
+Precomputed sample ladders (see sample_ladder in legoBlocks.py), by dataset.
+
+The index is one .npz of flat arrays, LADDER_FILE by default:
+  keys         'version:digest:human:evaluator', digest the sha256 of the dataset's CSV
+  rungs        offsets of each key's rungs in the per-rung arrays (len(keys) + 1)
+  k, distance  per rung, in increasing k
+  start        offsets of each rung's sample in index (one more than the rungs)
+  index        the samples, as indices into the dataset's points
+LadderIndex reads it on first use and again when its mtime changes, into ladders
+of the form sample_ladder() returns, so a lookup is a dict access and a pass over
+at most K rungs. Editing a CSV changes its digest, so its old ladders are no
+longer found; `python ladders.py` rebuilds the file. LADDER_VERSION: bump it when
+a change to the humans, evaluators or sample_ladder changes the ladders, so the
+old ones are no longer found either.
+"""
+import os
+import threading
+
+import numpy as np
+
+from legoBlocks import pick_rung
+
+LADDER_FILE = os.path.join('storage', 'ladders.npz')
+LADDER_VERSION = 1
+
+def ladder_key(digest, human, evaluator):
+    return '%d:%s:%s:%s' % (LADDER_VERSION, digest, human, evaluator)
+
+def read(path):
+    # {key: {k: (indices, distance)}}
+    with np.load(path) as f:
+        keys, rungs, k, distance, start, index = (f[name] for name in ('keys', 'rungs', 'k', 'distance', 'start', 'index'))
+    return {str(key): {int(k[r]): (index[start[r]:start[r + 1]], float(distance[r])) for r in range(rungs[e], rungs[e + 1])}
+            for e, key in enumerate(keys)}
+
+def write(path, ladders):
+    keys = sorted(ladders)
+    rungs = [sorted(ladders[key].items()) for key in keys]
+    samples = [np.asarray(index, dtype=np.int32) for ladder in rungs for _, (index, _) in ladder]
+    arrays = {
+        'keys': np.array(keys, dtype=str),
+        'rungs': np.cumsum([0] + [len(ladder) for ladder in rungs]),
+        'k': np.array([k for ladder in rungs for k, _ in ladder], dtype=np.int32),
+        'distance': np.array([d for ladder in rungs for _, (_, d) in ladder], dtype=float),
+        'start': np.cumsum([0] + [len(index) for index in samples]),
+        'index': np.concatenate(samples) if samples else np.empty(0, dtype=np.int32),
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+class LadderIndex:
+    def __init__(self, path=LADDER_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.ladders = {}
+
+    @property
+    def current(self):
+        try:
+            stamp = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        with self.lock:
+            if stamp != self.stamp:
+                self.ladders = read(self.path) if stamp is not None else {}
+                self.stamp = stamp
+            return self.ladders
+
+    def ladder(self, digest, human, evaluator):
+        return self.current.get(ladder_key(digest, human, evaluator))
+
+    def get(self, digest, human, evaluator, k=None, distance=None):
+        # (k, indices, distance) of the chosen rung, or None when there is no such rung
+        ladder = self.ladder(digest, human, evaluator)
+        return None if ladder is None else pick_rung(ladder, k, distance)
+
+    def preload(self):
+        # read the index up front, e.g. when a server starts; returns the number of ladders
+        return len(self.current)
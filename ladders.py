@@ -0,0 +1,72 @@
+"""
+Precomputes the sample ladders of the registered datasets: for every human and
+evaluator in pipeline.py, the best known sample of every size up to K (see
+sample_ladder in legoBlocks.py). Writes the index pipeline.run answers T_Ladder
+requests from (see ladderIndex.py).
+
+    python ladders.py [--K 10] [--data all] [-H ...] [-E ...] [--out storage/ladders.npz] [--force]
+
+Ladders already in the index for the same CSV contents and at least K sizes are
+kept unless --force; those of CSVs no longer registered, or since edited, are
+dropped. The index is rewritten after each ladder, so an interrupted run keeps
+what it computed. The benchmark/ series are not indexed: the pipeline only
+serves the registered datasets under data/, so their ladders would never be
+looked up.
+"""
+import argparse
+import sys
+import time
+
+import pipeline
+from ladderIndex import LADDER_FILE, ladder_key, read, write
+from legoBlocks import LADDER_K, sample_ladder
+
+def registered():
+    return [dataset['true_values'] for dataset in pipeline.registry.datasets]
+
+def build(filenames, humans, evaluators, K=LADDER_K, path=LADDER_FILE, force=False, log=print):
+    digests = {filename: pipeline.registry.digest(filename) for filename in registered()}
+    unregistered = [filename for filename in filenames if filename not in digests]
+    if unregistered:
+        raise Exception("Unregistered dataset %s" % ', '.join(unregistered))
+    if not (set(humans) <= set(pipeline.humans) and set(evaluators) <= set(pipeline.evaluators)):
+        raise Exception("Invalid pipeline component")
+    try:
+        existing = read(path)
+    except FileNotFoundError:
+        existing = {}
+    live = {ladder_key(digest, human, evaluator)
+            for digest in digests.values() for human in pipeline.humans for evaluator in pipeline.evaluators}
+    ladders = {key: ladder for key, ladder in existing.items() if key in live}
+    if len(ladders) < len(existing):
+        write(path, ladders)
+    for filename in filenames:
+        D = pipeline.load(filename)
+        n = len(D['x'])
+        for human in humans:
+            for evaluator in evaluators:
+                key = ladder_key(digests[filename], human, evaluator)
+                if not force and key in ladders and max(ladders[key]) >= min(K, n):
+                    continue
+                start = time.perf_counter()
+                ladders[key] = sample_ladder(D, getattr(pipeline, human), getattr(pipeline, evaluator), K)
+                write(path, ladders)
+                log('%-24s %-6s %-14s %5d points %3d sizes %8.2fs' %
+                    (filename, human, evaluator, n, len(ladders[key]), time.perf_counter() - start))
+    return ladders
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--K', type=int, default=LADDER_K, help='largest sample size')
+    parser.add_argument('--data', nargs='+', default=['all'])
+    parser.add_argument('-H', '--humans', nargs='+', default=pipeline.humans)
+    parser.add_argument('-E', '--evaluators', nargs='+', default=pipeline.evaluators)
+    parser.add_argument('--out', default=LADDER_FILE)
+    parser.add_argument('--force', action='store_true', help='recompute ladders already in the index')
+    args = parser.parse_args(argv)
+    filenames = registered() if args.data == ['all'] else args.data
+    ladders = build(filenames, args.humans, args.evaluators, args.K, args.out, args.force)
+    print('%d ladders in %s' % (len(ladders), args.out))
+
+if __name__ == '__main__':
+    sys.exit(main())
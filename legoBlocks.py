@@ -1,14 +1,111 @@
 from abc import ABC, abstractmethod
-import matplotlib.pyplot as plt
-import matplotlib
 import math
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.base import BaseEstimator, RegressorMixin
 import random
-import os
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+import contextvars
+import queue
+import threading
+from contextlib import contextmanager
+from memoStore import MemoStore, array_digest, memo_key
+from profiler import ProfiledEvaluator, ProfiledHuman, profiling, section
+
+"""
+Progress reporting. Teachers call report_progress() whenever their incumbent
+improves and at least once per outer iteration; done/total say how far along
+they are when that is known. A caller that wants the updates (e.g. a job runner)
+installs a callback with progress_scope(). The callback may raise Cancelled to
+stop the teacher. Inside deadline_scope(deadline), a report after the deadline
+(a time.monotonic() value) raises Cancelled('Timed out'); it is independent of
+the callback, so a server can bound a request's runs, streamed or batched. Without
+either a report is two context variable lookups. Threads that run teachers for a
+caller (anytime, pipeline.run_batch) start in the caller's context.
+"""
+_progress = contextvars.ContextVar('progress', default=None)
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+class Cancelled(Exception):
+    pass
+
+@contextmanager
+def progress_scope(callback):
+    token = _progress.set(callback)
+    try:
+        yield
+    finally:
+        _progress.reset(token)
+
+@contextmanager
+def deadline_scope(deadline):
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def report_progress(distance=None, sample=None, done=None, total=None):
+    callback = _progress.get()
+    if callback is not None:
+        callback(distance=distance, sample=sample, done=done, total=total)
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise Cancelled('Timed out')
+
+"""
+Anytime mode: runs teacher T in a background thread and yields (sample, distance)
+every time its reported incumbent improves, then the teacher's final result.
+Teachers that report no samples (the white-box ones) only yield the final result.
+Closing the generator early cancels the teacher at its next report; a deadline
+that cancels it raises Cancelled from the generator. anytime_events() yields the
+same as ('update', (sample, distance)) pairs and a last ('done', result), for
+callers that treat the final result differently.
+"""
+def anytime(T, D, H, evaluator, **params):
+    events = anytime_events(T, D, H, evaluator, **params)
+    try:
+        for _, value in events:
+            yield value
+    finally:
+        events.close()
+
+def anytime_events(T, D, H, evaluator, **params):
+    updates = queue.Queue()
+    stop = threading.Event()
+    best = [math.inf]
+
+    def callback(distance=None, sample=None, done=None, total=None):
+        if stop.is_set():
+            raise Cancelled()
+        if sample is not None and distance is not None and distance < best[0]:
+            best[0] = distance
+            updates.put(('update', (sample, distance)))
+
+    def work():
+        try:
+            with progress_scope(callback):
+                updates.put(('done', T(D, H, evaluator, **params)))
+        except Cancelled as e:
+            updates.put(('cancelled', e))
+        except Exception as e:
+            updates.put(('error', e))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True).start()
+    try:
+        while True:
+            kind, value = updates.get()
+            if kind == 'update':
+                yield kind, value
+            elif kind == 'done':
+                yield kind, value
+                return
+            else:
+                # an error, or Cancelled by a deadline (after close() nobody listens)
+                raise value
+    finally:
+        stop.set()
 
 class IHumanProxy(ABC):
     
@@ -20,25 +117,41 @@ class IHumanProxy(ABC):
     def predict(self, x):
         pass
 
+    @classmethod
+    def batch_predict(cls, X, Y, x):
+        # predictions at x of the humans fitted to each row of X, Y: (rows, len(x))
+        return np.stack([cls(Xi, Yi).predict(x) for Xi, Yi in zip(X, Y)])
+
 class Pipeline:
     """
     H: human proxy. Has fit(x, y), predict(x)
     T: teacher.
     evaluator: evaluates sample w.r.t original data.
+    params: teacher options, e.g. workers/restarts/seed for T_HillClimbingRestart
+    Inside profiler.profile_scope() the teacher gets instrumented H and evaluator.
     """
-    def __init__(self, human_proxy, teacher, evaluator):
+    def __init__(self, human_proxy, teacher, evaluator, **params):
         # if not isinstance(human_proxy, IHumanProxy): raise Exception('Bad interface')
         self.H = human_proxy
         self.T = teacher
         self.E = evaluator
+        self.params = params  # extra keyword arguments for the teacher
 
-    def generate_sample(self, D):
-        return self.T(D, self.H, self.E)
+    def generate_sample(self, D, **options):
+        # options: per-run teacher arguments on top of params, e.g. T_Auto's info dict
+        params = dict(self.params, **options)
+        D = prepare(D)
+        if profiling():
+            with section(self.T.__name__):
+                return self.T(D, ProfiledHuman(self.H), ProfiledEvaluator(self.E), **params)
+        return self.T(D, self.H, self.E, **params)
 
     def getScore(self, D, sample):
         return self.E(D, self.H(sample[0], sample[1]))
 
     def generate_plots(self, DD, comparison=True):
+        # matplotlib is only needed here, so it stays off the import path of the app
+        import matplotlib.pyplot as plt
         f = plt.figure()
         f.set_figwidth(25)
         f.set_figheight((int(len(DD)/6) + 1)*4)
@@ -72,395 +185,1611 @@ class Pipeline:
         plt.subplots_adjust(hspace=0.25)
         plt.show()
 
-def E_MSE(D, model):
-    x = D['x'].reshape(-1, 1)
-    y = D['y']
-    y_predicted = model.predict(x)
-    return mean_squared_error(y, y_predicted)
+"""
+D with what evaluators need from it computed once: x as a column for predict,
+y, its length and its extremes. It is still the dict D, so teachers and humans
+use it as before. Pipeline.generate_sample hands the teacher a prepared D; an
+evaluator given a plain dict prepares it for that call.
+"""
+class PreparedData(dict):
+    def __init__(self, D):
+        super().__init__(D)
+        self.X = np.asarray(D['x']).reshape(-1, 1)
+        self.y = np.asarray(D['y']).reshape(-1)
+        self.n = len(self.y)
+        self.ymin, self.ymax = self.y.min(), self.y.max()
+
+def prepare(D):
+    return D if isinstance(D, PreparedData) else PreparedData(D)
+
+"""
+Evaluators are built from terms (MSE, Extrema) and their weighted sums, e.g.
+MSE() + 10 * Extrema(). Calling one on (D, model) predicts once and hands the
+predictions to every term. batch(D, predicted) scores a (candidates, n) array of
+predictions in one reduction and returns one distance per candidate.
+incremental(D, stats) scores the running statistics of PLIncrementalState
+(PLStats) and coarse(D, stats) bounds the distance from a Pyramid's CoarseStats
+as (lower, upper). Terms implement distance(P, predicted) on a prepared D.
+"""
+class Evaluator:
+    def __init__(self):
+        self.__name__ = type(self).__name__
+
+    def __call__(self, D, model):
+        P = prepare(D)
+        return self.distance(P, model.predict(P.X))
+
+    def batch(self, D, predicted):
+        return self.distance(prepare(D), np.asarray(predicted))
+
+    def __add__(self, other):
+        return WeightedSum([(1, self), (1, other)])
+
+    def __rmul__(self, weight):
+        return WeightedSum([(weight, self)])
+
+class WeightedSum(Evaluator):
+    def __init__(self, terms):
+        super().__init__()
+        # nested sums are flattened
+        self.terms = []
+        for weight, term in terms:
+            if isinstance(term, WeightedSum):
+                self.terms.extend((weight * w, t) for w, t in term.terms)
+            else:
+                self.terms.append((weight, term))
+
+    def distance(self, P, predicted):
+        return sum(w * term.distance(P, predicted) for w, term in self.terms)
+
+    def incremental(self, D, stats):
+        return sum(w * term.incremental(D, stats) for w, term in self.terms)
+
+    def coarse(self, D, stats):
+        lower = upper = 0.0
+        for w, term in self.terms:
+            lo, hi = term.coarse(D, stats)
+            lower, upper = (lower + w * lo, upper + w * hi) if w >= 0 else (lower + w * hi, upper + w * lo)
+        return lower, upper
 
+def named(name, evaluator):
+    evaluator.__name__ = name
+    return evaluator
+
+class MSE(Evaluator):
+    def distance(self, P, predicted):
+        return np.mean((P.y - predicted) ** 2, axis=-1)
+
+    def incremental(self, D, stats):
+        return stats.sse / stats.n
+
+    def coarse(self, D, stats):
+        return stats.sse[0] / stats.n, stats.sse[1] / stats.n
+
+E_MSE = named('E_MSE', MSE())
+
+"""
+The least squares humans are fitted in closed form with NumPy, the way
+scikit-learn's LinearRegression fits them (centered features, minimum-norm least
+squares), so they predict the same without its per-fit validation overhead.
+H_quad departs from it on purpose in one way: with 3 or more distinct x it fits on
+x rescaled to [-1, 1]. On raw years x^2 is so ill conditioned that the tolerance
+cut a real parabola, leaving fits no sample could make exact, unlike the ones
+T_quad3 scores. bench_humans.py checks them against scikit-learn when it is
+installed.
+"""
 class H_OLS(IHumanProxy):
     def __init__(self, x, y):
-        self.model = LinearRegression()
         self.fit(x, y)
         
     def fit(self, x, y):
-        x = np.array(x).reshape(-1,1)
-        self.model.fit(x, y)
+        x = np.asarray(x, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        xc = x - x.mean()
+        Sxx = xc @ xc
+        # coincident x: the flat line through the mean
+        self.slope = (xc @ (y - y.mean())) / Sxx if Sxx > 0 else 0.0
+        self.intercept = y.mean() - self.slope * x.mean()
 
     def predict(self, x):
-        x = np.array(x).reshape(-1,1)
-        return self.model.predict(x)
+        return self.slope * np.asarray(x, dtype=float).reshape(-1) + self.intercept
+
+    @classmethod
+    def batch_predict(cls, X, Y, x):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        xc = X - X.mean(axis=1, keepdims=True)
+        Sxx = np.sum(xc * xc, axis=1)
+        Sxy = np.sum(xc * (Y - Y.mean(axis=1, keepdims=True)), axis=1)
+        slope = np.where(Sxx > 0, Sxy / np.where(Sxx > 0, Sxx, 1), 0.0)
+        intercept = Y.mean(axis=1) - slope * X.mean(axis=1)
+        return slope[:, None] * np.asarray(x, dtype=float).reshape(-1) + intercept[:, None]
+
+    def deviation(self, lo, hi):
+        # a line never leaves its chord (see Pyramid.stats)
+        return np.zeros(np.shape(lo))
 
 """
 Assumes: H is a oridnary least squares learner
 Outputs: sample of size 2
 Note: This teacher does not use actual H and E in the pipeline (White-Box)
+
+Every pair (i, j) is scored in closed form: the line through the two points is
+computed directly and its MSE over D follows from the sums of x, y, x^2, xy and
+y^2, so no estimator is fitted per pair. Pairs are scored in row blocks of at
+most `chunk` cells to keep memory bounded on long series. The few pairs whose
+moment-based score is within rounding of the best are rescored on the residuals,
+so the result matches the pair-by-pair search (first pair wins on ties).
 """
-def T_OLS2(D, H, evaluator):
+OLS2_CHUNK = 1 << 20
+OLS2_RESCORE = 256
+
+def _pair_lines(xi, yi, xj, yj):
+    # line through (xi, yi) and (xj, yj); equal x gives the flat line through the mean like LinearRegression
+    dx = xj - xi
+    same = dx == 0
+    slope = np.where(same, 0.0, (yj - yi) / np.where(same, 1.0, dx))
+    intercept = np.where(same, (yi + yj) / 2, yi - slope * xi)
+    return slope, intercept
+
+def _keep_smallest(limit, lower, *index):
+    # the `limit` entries with the smallest lower bound, with their index arrays
+    if len(lower) > limit:
+        keep = np.argpartition(lower, limit - 1)[:limit]
+        return (lower[keep],) + tuple(ix[keep] for ix in index)
+    return (lower,) + index
+
+def T_OLS2(D, H, evaluator, chunk=OLS2_CHUNK):
     x = D['x'].reshape(-1, 1)
     y = D['y']
+    n = len(x)
+    if n < 2:
+        return [[],[]], math.inf
+    xf = x.reshape(-1).astype(float)
+    yf = np.asarray(y, dtype=float)
+    # centering keeps the moment expansion below from cancelling catastrophically
+    xc = xf - xf.mean()
+    yc = yf - yf.mean()
+    Sx, Sy, Sxx, Sxy, Syy = xc.sum(), yc.sum(), xc @ xc, xc @ yc, yc @ yc
+    tol = 1e-10
+
+    rows = max(1, chunk // n)
+    bestUpper = math.inf
+    cand = (np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=int))
+    cols = np.arange(n)
+    for start in range(0, n - 1, rows):
+        report_progress(done=start, total=n - 1)
+        i = np.arange(start, min(start + rows, n - 1))[:, None]
+        a, b = _pair_lines(xc[i], yc[i], xc[None, :], yc[None, :])
+        sse = Syy - 2*a*Sxy - 2*b*Sy + a*a*Sxx + 2*a*b*Sx + n*b*b
+        slack = tol * (Syy + a*a*Sxx + n*b*b)
+        sse[cols[None, :] <= i] = math.inf
+        bestUpper = min(bestUpper, np.min(sse + slack))
+        lower = sse - slack
+        ii, jj = np.nonzero(lower <= bestUpper)
+        lower, ii, jj = _keep_smallest(OLS2_RESCORE, lower[ii, jj], ii + start, jj)
+        cand = _keep_smallest(OLS2_RESCORE, *(np.concatenate(pair) for pair in zip(cand, (lower, ii, jj))))
+
+    lower, ii, jj = cand
+    keep = lower <= bestUpper
     minDist = math.inf
-    minS = [[],[]]
-    h_tilde = LinearRegression()
-    for i in range(len(x)):
-        for j in range(i+1, len(x)):
-            if i==j: continue
-            x_sample = np.array([x[i], x[j]]).reshape(-1, 1)
-            y_sample = np.array([y[i], y[j]])
-            model = h_tilde.fit(x_sample, y_sample)
-            y_predicted = h_tilde.predict(x)
-            distance = mean_squared_error(y, y_predicted)
-            if (distance < minDist):
-                minDist = distance
-                minS[0] = x_sample
-                minS[1] = y_sample
+    minPair = None
+    for i, j in sorted(zip(ii[keep].tolist(), jj[keep].tolist())):
+        a, b = _pair_lines(xf[i], yf[i], xf[j], yf[j])
+        distance = np.mean((yf - (a * xf + b)) ** 2)
+        if (distance < minDist):
+            minDist = distance
+            minPair = (i, j)
+
+    i, j = minPair
+    minS = [np.array([x[i], x[j]]).reshape(-1, 1), np.array([y[i], y[j]])]
     return minS, minDist
 
+def _quad_frame(X):
+    # center and half-range of each row of X, or (0, 1) for rows with fewer than 3 distinct x,
+    # i.e. none strictly between the row's least and greatest
+    X = np.atleast_2d(X)
+    lo, hi = X.min(axis=1), X.max(axis=1)
+    full = ((X > lo[:, None]) & (X < hi[:, None])).any(axis=1)
+    return np.where(full, (hi + lo) / 2, 0.0), np.where(full, (hi - lo) / 2, 1.0)
+
 class H_quad(IHumanProxy):
     def __init__(self, x, y):
-        self.poly = PolynomialFeatures(degree=2, include_bias=False)
-        self.model = LinearRegression()
         self.fit(x, y)
         
     def fit(self, x, y):
-        x = np.array(x).reshape(-1,1)
-        x = self.poly.fit_transform(x)
-        self.model.fit(x, y)
+        x = np.asarray(x, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        # x is fitted rescaled to [-1, 1], where x^2 stays well conditioned (years, say), so the
+        # least squares parabola through 3 points is the one T_quad3 interpolates. Fewer than 3
+        # distinct x leave the fit underdetermined; those stay on raw x, where lstsq's minimum-norm
+        # coefficients (dropping singular values below LinearRegression's default tol) are
+        # LinearRegression's
+        (self.center,), (self.scale,) = _quad_frame(x)
+        u = (x - self.center) / self.scale
+        F = np.column_stack([u, u * u])
+        mean = F.mean(axis=0)
+        self.coef = np.linalg.lstsq(F - mean, y - y.mean(), rcond=1e-6)[0]
+        self.intercept = y.mean() - mean @ self.coef
 
     def predict(self, x):
-        x = np.array(x).reshape(-1,1)
-        return self.model.predict(self.poly.fit_transform(x))
+        u = (np.asarray(x, dtype=float).reshape(-1) - self.center) / self.scale
+        return self.coef[0] * u + self.coef[1] * (u * u) + self.intercept
+
+    @classmethod
+    def batch_predict(cls, X, Y, x):
+        # pinv applies the same cut-off as fit's lstsq, to every row at once
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        center, scale = _quad_frame(X)
+        U = (X - center[:, None]) / scale[:, None]
+        F = np.stack([U, U * U], axis=-1)
+        mean = F.mean(axis=1, keepdims=True)
+        coef = (np.linalg.pinv(F - mean, rcond=1e-6) @ (Y - Y.mean(axis=1, keepdims=True))[..., None])[..., 0]
+        intercept = Y.mean(axis=1) - np.sum(mean[:, 0] * coef, axis=1)
+        u = (np.asarray(x, dtype=float).reshape(-1)[None, :] - center[:, None]) / scale[:, None]
+        return coef[:, :1] * u + coef[:, 1:] * (u * u) + intercept[:, None]
+
+    def deviation(self, lo, hi):
+        # a parabola a*x^2 + ... is at most |a| * (hi - lo)^2 / 4 from its chord over [lo, hi]
+        return abs(self.coef[1]) / self.scale ** 2 * (np.asarray(hi) - np.asarray(lo)) ** 2 / 4
+
+"""
+Assumes: H is a quadratic least squares learner
+Outputs: sample of size 3
+Note: This teacher does not use actual H and E in the pipeline (White-Box)
+
+The parabola through each triple is interpolated in closed form (divided
+differences on x rescaled to [-1, 1]) and scored from the Gram matrix of
+[1, x, x^2] over D, so a block of triples costs a few array operations instead of
+one H_quad fit each. Triples within rounding of the best are re-evaluated on the
+full D['x'] grid as one matrix product. Triples with repeated x fall back to H_quad.
+
+prune='shortlist' keeps the teacher interactive on long series: only triples of
+the `shortlist` points closest to the least squares parabola of D are searched
+exhaustively, then each of the three points is moved to its best position in D
+in turn until nothing improves. The result is not guaranteed optimal.
+"""
+QUAD3_CHUNK = 1 << 20
+QUAD3_RESCORE = 256
+QUAD3_SHORTLIST = 60
+
+def _quad_moments(x, y):
+    # rescale x to [-1, 1] and center y so the moment expansion stays well conditioned
+    lo, hi = x.min(), x.max()
+    u = (x - (lo + hi) / 2) / ((hi - lo) / 2 if hi > lo else 1.0)
+    yc = y - y.mean()
+    V = np.stack([np.ones_like(u), u, u * u], axis=1)
+    return u, yc, V, V.T @ V, V.T @ yc, yc @ yc
+
+def _quad_coefficients(u, yc, i, j, k):
+    # coefficients (c0, c1, c2) of the parabola through the triples; rows with repeated x come back nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ui, uj, uk = u[i], u[j], u[k]
+        d1 = (yc[j] - yc[i]) / (uj - ui)
+        d2 = ((yc[k] - yc[j]) / (uk - uj) - d1) / (uk - ui)
+        C = np.stack([yc[i] - d1 * ui + d2 * ui * uj, d1 - d2 * (ui + uj), d2], axis=-1)
+    C[(ui == uj) | (uj == uk) | (ui == uk)] = np.nan
+    return C
+
+def _quad_sse(C, G, b, Syy, tol=1e-10):
+    # squared error of each parabola over D from the moments, with a rounding bound
+    fit = np.einsum('...i,ij,...j->...', C, G, C)
+    return Syy - 2 * (C @ b) + fit, tol * (Syy + fit)
+
+def _quad_degenerate_sse(x, y, triples):
+    sse = np.empty(len(triples))
+    for t, (i, j, k) in enumerate(triples):
+        h_tilde = H_quad(x[[i, j, k]], y[[i, j, k]])
+        sse[t] = np.sum((y - h_tilde.predict(x)) ** 2)
+    return sse
+
+def _quad_best(x, y, V, u, yc, I, J, K):
+    # exact pass over the candidate triples: one matrix product on the full grid, first triple wins ties
+    order = np.lexsort((K, J, I))
+    I, J, K = I[order], J[order], K[order]
+    C = _quad_coefficients(u, yc, I, J, K)
+    mse = np.mean((yc[None, :] - C @ V.T) ** 2, axis=1)
+    bad = np.isnan(mse)
+    if bad.any():
+        mse[bad] = _quad_degenerate_sse(x, y, zip(I[bad], J[bad], K[bad])) / len(y)
+    t = int(np.argmin(mse))
+    return (I[t], J[t], K[t]), mse[t]
+
+def _quad_shortlist(u, yc, V, size):
+    # points closest to the least squares parabola, spread over the three thirds of the x range
+    coef = np.linalg.lstsq(V, yc, rcond=None)[0]
+    residual = np.abs(yc - V @ coef)
+    order = np.argsort(u, kind='stable')
+    picks = [part[np.argsort(residual[part], kind='stable')[:max(1, size // 3)]]
+             for part in np.array_split(order, 3)]
+    return np.unique(np.concatenate(picks))
 
-def T_quad3(D, H, evaluator):
+def _quad_candidates(x, y, C, G, b, Syy, I, J, K, bestUpper):
+    # triples whose score may still be the best, with their lower bounds
+    sse, slack = _quad_sse(C, G, b, Syy)
+    bad = np.isnan(sse)
+    if bad.any():
+        sse[bad] = _quad_degenerate_sse(x, y, zip(I[bad], J[bad], K[bad]))
+        slack[bad] = 0
+    bestUpper = min(bestUpper, np.min(sse + slack))
+    keep = sse - slack <= bestUpper
+    return _keep_smallest(QUAD3_RESCORE, sse[keep] - slack[keep], I[keep], J[keep], K[keep]), bestUpper
+
+def T_quad3(D, H, evaluator, prune=None, shortlist=QUAD3_SHORTLIST, chunk=QUAD3_CHUNK):
     x = D['x'].reshape(-1, 1)
     y = D['y']
-    minDist = math.inf
-    minS = [[],[]]
-    poly = PolynomialFeatures(degree=2, include_bias=True)
-    for i in range(len(x)):
-        for j in range(i+1, len(x)):
-            for k in range(j+1, len(x)):
-                x_sample = np.array([x[i], x[j], x[k]])
-                y_sample = np.array([y[i], y[j], y[k]])
-                # h_tilde.fit(poly.fit_transform(x_sample), y_sample)
-                h_tilde = H_quad(x_sample, y_sample)
-                y_predicted = h_tilde.predict(x)
-                distance = mean_squared_error(y, y_predicted)
-                if (distance < minDist):
-                    minDist = distance
-                    minS[0] = x_sample
-                    minS[1] = y_sample
+    n = len(x)
+    if n < 3:
+        return [[],[]], math.inf
+    xf = x.reshape(-1).astype(float)
+    yf = np.asarray(y, dtype=float)
+    u, yc, V, G, b, Syy = _quad_moments(xf, yf)
+    empty = np.empty(0, dtype=int)
+    cand = (np.empty(0), empty, empty, empty)
+    bestUpper = math.inf
+
+    if prune is None:
+        for i in range(n - 2):
+            # triples left after i shrink like (n - i)^3
+            report_progress(done=n**3 - (n - i)**3, total=n**3)
+            jj, kk = np.triu_indices(n - i - 1, 1)
+            jj += i + 1
+            kk += i + 1
+            for start in range(0, len(jj), chunk):
+                J, K = jj[start:start + chunk], kk[start:start + chunk]
+                I = np.full(len(J), i)
+                C = _quad_coefficients(u, yc, I, J, K)
+                found, bestUpper = _quad_candidates(xf, yf, C, G, b, Syy, I, J, K, bestUpper)
+                cand = _keep_smallest(QUAD3_RESCORE, *(np.concatenate(pair) for pair in zip(cand, found)))
+        lower, I, J, K = cand
+        keep = lower <= bestUpper
+        (i, j, k), minDist = _quad_best(xf, yf, V, u, yc, I[keep], J[keep], K[keep])
+    elif prune == 'shortlist':
+        S = _quad_shortlist(u, yc, V, shortlist)
+        if len(S) < 3:
+            S = np.arange(n)
+        si, sj, sk = np.array(list(itertools.combinations(range(len(S)), 3))).T
+        I, J, K = S[si], S[sj], S[sk]
+        C = _quad_coefficients(u, yc, I, J, K)
+        sse, _ = _quad_sse(C, G, b, Syy)
+        sse[np.isnan(sse)] = math.inf
+        t = int(np.argmin(sse))
+        triple, best = [I[t], J[t], K[t]], sse[t]
+        # move one point at a time to its best position anywhere in D
+        improved = True
+        while improved:
+            improved = False
+            for p in range(3):
+                T = np.array([triple] * n)
+                T[:, p] = np.arange(n)
+                C = _quad_coefficients(u, yc, T[:, 0], T[:, 1], T[:, 2])
+                sse, _ = _quad_sse(C, G, b, Syy)
+                sse[np.isnan(sse)] = math.inf
+                t = int(np.argmin(sse))
+                if sse[t] < best - 1e-12 * Syy:
+                    triple[p], best = t, sse[t]
+                    improved = True
+        i, j, k = sorted(triple)
+        (i, j, k), minDist = _quad_best(xf, yf, V, u, yc, np.array([i]), np.array([j]), np.array([k]))
+    else:
+        raise Exception("Invalid prune mode")
+
+    minS = [np.array([x[i], x[j], x[k]]), np.array([y[i], y[j], y[k]])]
     return minS, minDist
 
+def T_quad3Shortlist(D, H, evaluator):
+    return T_quad3(D, H, evaluator, prune='shortlist')
+
 #Piecewise Linear "connect the dots" learner
+#X, y: knots in increasing x, or 2-D (candidates x knots) arrays to predict a batch of samples at once
 class H_PL(IHumanProxy):
+    window = None
+
     def __init__(self, x, y):
         self.fit(x, y)
+
+    @classmethod
+    def incremental(cls, D, evaluator):
+        return PLIncrementalState(D, evaluator, window=cls.window)
+
+    @classmethod
+    def batch_predict(cls, X, Y, x):
+        # fit and predict take a stack of samples as is
+        return cls(X, Y).predict(x)
         
     def fit(self, X, y):
-        self.X = X
-        self.y = y
+        self.y = np.asarray(y, dtype=float)
+        self.X = np.asarray(X, dtype=float).reshape(self.y.shape)
     
     def predict(self, dX):
-        dy = np.ones(len(dX))
-        if len(self.X) == 1:
-            return dy * self.y[0]
-        for i in range(len(dX)):
-            dx = dX[i]
-            x1 = 0
-            x2 = 0
-            k = len(self.X)
-            for j in range(len(self.X)):
-                if dx < self.X[j]:
-                    k = j
-                    break
-            if k == 0:
-                x1 = 0
-                x2 = 1
-            elif k == len(self.X):
-                x1 = len(self.X) - 2
-                x2 = len(self.X) - 1
-            else:
-                x1 = k - 1
-                x2 = k
-            
-            denom = (self.X[x2] - self.X[x1]) * (dx - self.X[x1])
-            if (denom == 0):
-                dy[i] = self.y[x1]
-            else:
-                dy[i] = self.y[x1] + (self.y[x2] - self.y[x1]) / (self.X[x2] - self.X[x1]) * (dx - self.X[x1])       
-        return dy
+        dX = np.asarray(dX, dtype=float).reshape(-1)
+        X, y = self.X, self.y
+        m = X.shape[-1]
+        if m == 1:
+            return np.repeat(y[..., :1], len(dX), axis=-1)
+        # k: first knot right of each query point (m if none); the chord is (k-1, k) clipped to the ends
+        k = _first_knot_after(X, dX)
+        x1 = np.clip(k - 1, 0, m - 2)
+        x2 = x1 + 1
+        if X.ndim == 1:
+            X1, X2, y1, y2 = X[x1], X[x2], y[x1], y[x2]
+        else:
+            X1, X2, y1, y2 = (np.take_along_axis(v, c, axis=-1) for v, c in ((X, x1), (X, x2), (y, x1), (y, x2)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denom = (X2 - X1) * (dX - X1)
+            return np.where(denom == 0, y1, y1 + (y2 - y1) / (X2 - X1) * (dX - X1))
+
+    def deviation(self, lo, hi):
+        # straight between knots; a knot strictly inside (lo, hi) bends it by an unknown amount
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        if self.X.ndim != 1:
+            return np.full(lo.shape, math.inf)
+        X = np.sort(self.X)
+        inside = np.searchsorted(X, hi, side='left') > np.searchsorted(X, lo, side='right')
+        return np.where(inside, math.inf, 0.0)
+
+PL_BATCH_CELLS = 1 << 24
+
+def _first_knot_after(X, dX):
+    if X.ndim == 1 and np.all(X[1:] >= X[:-1]):
+        return np.searchsorted(X, dX, side='right')
+    # unsorted knots or a batch: compare every query point with every knot, a block of rows at a time
+    m = X.shape[-1]
+    rows = X.reshape(-1, m)
+    k = np.empty((len(rows), len(dX)), dtype=int)
+    step = max(1, PL_BATCH_CELLS // max(len(dX) * m, 1))
+    for start in range(0, len(rows), step):
+        after = dX[None, :, None] < rows[start:start + step, None, :]
+        k[start:start + step] = np.where(after.any(axis=-1), after.argmax(axis=-1), m)
+    return k.reshape(X.shape[:-1] + (len(dX),))
 
 class H_PL7(H_PL):
+    window = 7
+
     def __init__(self, X, y):
         self.fit(X, y)
         
     def fit(self, X, y):
-        if (len(X) > 7):
-            self.X = X[len(X)-7:]
-            self.y = y[len(y)-7:]
-        else:
-            self.X = X
-            self.y = y
-    
-    def predict(self, dX):
-        return super().predict(dX)
+        super().fit(X, y)
+        self.X = self.X[..., -self.window:]
+        self.y = self.y[..., -self.window:]
+
+"""
+Running evaluation state of a piecewise-linear human over D.
+
+Each chord of the sample only predicts the data points between its knots (the
+end chords also cover the points beyond them), so its squared error and the
+extrema of its predictions can be kept per chord. score() reuses every chord
+shared with the committed sample and only predicts the points under the chords
+a move changed. Knots must be in increasing x, as the teachers pass them.
+window: only the last `window` knots are used, like H_PL7.
+"""
+PLStats = namedtuple('PLStats', ['n', 'sse', 'pmin', 'pmax', 'ymin', 'ymax'])
+
+class PLIncrementalState:
+    def __init__(self, D, evaluator, window=None):
+        self.D = D
+        self.evaluator = evaluator
+        self.window = window
+        x = np.asarray(D['x'], dtype=float).reshape(-1)
+        y = np.asarray(D['y'], dtype=float).reshape(-1)
+        order = np.argsort(x, kind='stable')
+        self.xs, self.ys = x[order], y[order]
+        self.ymin, self.ymax = y.min(), y.max()
+        self.committed = {}
+        self.scored = {}
+
+    def _chord(self, key):
+        X1, y1, X2, y2, first, last = key
+        lo = 0 if first else np.searchsorted(self.xs, X1, side='left')
+        hi = len(self.xs) if last else np.searchsorted(self.xs, X2, side='left')
+        dX = self.xs[lo:hi]
+        if len(dX) == 0:
+            return 0.0, math.inf, -math.inf
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denom = (X2 - X1) * (dX - X1)
+            predicted = np.where(denom == 0, y1, y1 + (y2 - y1) / (X2 - X1) * (dX - X1))
+        return np.sum((self.ys[lo:hi] - predicted) ** 2), predicted.min(), predicted.max()
+
+    def _chords(self, X, y):
+        X = np.asarray(X, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        if self.window is not None:
+            X, y = X[-self.window:], y[-self.window:]
+        m = len(X)
+        if m == 1:
+            # a single knot predicts its y everywhere
+            return {(X[0], y[0], X[0], y[0], True, True): (np.sum((self.ys - y[0]) ** 2), y[0], y[0])}
+        chords = {}
+        for s in range(m - 1):
+            key = (X[s], y[s], X[s + 1], y[s + 1], s == 0, s == m - 2)
+            chords[key] = self.committed.get(key) or self.scored.get(key) or self._chord(key)
+        return chords
+
+    def _distance(self, chords):
+        sse, pmin, pmax = 0.0, math.inf, -math.inf
+        for s, lo, hi in chords.values():
+            sse += s
+            pmin = min(pmin, lo)
+            pmax = max(pmax, hi)
+        stats = PLStats(len(self.xs), sse, pmin, pmax, self.ymin, self.ymax)
+        return self.evaluator.incremental(self.D, stats)
+
+    def score(self, X, y):
+        self.scored = self._chords(X, y)
+        return self._distance(self.scored)
+
+    def commit(self, X, y):
+        self.committed = self._chords(X, y)
+        return self._distance(self.committed)
+
+"""
+Optimal "connect the dots" sample by bottom-up dynamic programming.
+
+A sample of k data points is scored segment by segment: the chord through the
+first two knots covers every point up to the second knot, each following chord
+covers the points after its left knot up to its right knot, and the last chord
+covers everything after its left knot. With normalize='segment' each segment
+contributes its own MSE (the objective T_PL has always used); with
+normalize='total' segments are summed and divided by len(D), which is exactly
+the MSE of H_PL on D. A 2-point sample is a single chord over all of D.
 
-def T_PL(D, n, evaluator):
+Every chord's squared error comes from prefix sums of x, y, x^2, xy and y^2, so
+the cost tables are filled with a few array operations. The tables are kept
+whole when they have at most PL_TABLE_LIMIT cells and recomputed in row blocks
+otherwise. Layer m of the table holds, for every knot, the cost of the best m
+knots after it and the next knot to take, so one run answers every k <= K. For
+long series the layer tables are saved in the memo store, keyed by the data,
+the number of layers and the objective, and memory-mapped back on later runs.
+"""
+PL_TABLE_LIMIT = 1 << 22
+PL_CHUNK = 1 << 20
+# layer tables of series this long are kept in the memo store (storage/memo)
+PL_MEMO_MIN = 2000
+PL_MEMO = MemoStore()
+
+def _chord_sse(xa, ya, xb, yb, cnt, Sx, Sy, Sxx, Sxy, Syy):
+    # squared error of the line through (xa, ya) and (xb, yb) over cnt points with these sums
+    slope, intercept = _pair_lines(xa, ya, xb, yb)
+    sse = Syy - 2*slope*Sxy - 2*intercept*Sy + slope*slope*Sxx + 2*slope*intercept*Sx + cnt*intercept*intercept
+    return np.maximum(sse, 0)
+
+class _PLSegmentCosts:
+    def __init__(self, x, y, normalize):
+        if normalize not in ('segment', 'total'):
+            raise Exception("Invalid normalize mode")
+        self.n = len(x)
+        self.normalize = normalize
+        # centered data keeps the moment expansion from cancelling
+        self.x = x - x.mean()
+        self.y = y - y.mean()
+        zero = np.zeros(1)
+        self.Px, self.Py, self.Pxx, self.Pxy, self.Pyy = (np.concatenate([zero, np.cumsum(v)]) for v in
+            (self.x, self.y, self.x * self.x, self.x * self.y, self.y * self.y))
+        self.tables = {}
+
+    def _cost(self, a, b, lo, hi):
+        # error of the chord a -> b over the data range [lo, hi)
+        cnt = hi - lo
+        sse = _chord_sse(self.x[a], self.y[a], self.x[b], self.y[b], cnt,
+                         *(P[hi] - P[lo] for P in (self.Px, self.Py, self.Pxx, self.Pxy, self.Pyy)))
+        if self.normalize == 'total':
+            return sse / self.n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(cnt > 0, sse / np.maximum(cnt, 1), 0)
+
+    def rows(self, kind, start, stop):
+        """
+        kind: 'first' (chord i -> j over [0, j]), 'middle' (a -> b over (a, b]),
+              'last' (a -> b over (a, n)) or 'whole' (i -> j over all of D)
+        returns the costs of rows start..stop-1 against every right knot, inf where b <= a
+        """
+        if kind in self.tables:
+            return self.tables[kind][start:stop]
+        a = np.arange(start, stop)[:, None]
+        b = np.arange(self.n)[None, :]
+        lo = {'first': 0, 'middle': a + 1, 'last': a + 1, 'whole': 0}[kind]
+        hi = {'first': b + 1, 'middle': b + 1, 'last': self.n, 'whole': self.n}[kind]
+        cost = self._cost(a, b, lo, hi)
+        cost[b <= a] = math.inf
+        return cost
+
+    def table(self, kind):
+        if kind not in self.tables and self.n * self.n <= PL_TABLE_LIMIT:
+            self.tables[kind] = self.rows(kind, 0, self.n)
+        return self.tables.get(kind)
+
+    def blocks(self, kind):
+        self.table(kind)
+        rows = max(1, PL_CHUNK // max(self.n, 1))
+        for start in range(0, self.n, rows):
+            yield start, self.rows(kind, start, min(start + rows, self.n))
+
+def PL_DP(D, K, normalize='segment', ks=None):
+    """
+    K: largest sample size
+    ks: sample sizes to reconstruct (default: every 2 <= k <= K that fits in D)
+    returns {k: (indices of the optimal sample, distance)}
+    """
+    x = np.asarray(D['x'], dtype=float).reshape(-1)
+    y = np.asarray(D['y'], dtype=float).reshape(-1)
+    n = len(x)
+    if ks is None:
+        ks = range(2, K + 1)
+    ks = [k for k in ks if 2 <= k <= min(K, n)]
+    if not ks:
+        return {}
+    costs = _PLSegmentCosts(x, y, normalize)
+    layers = max(ks) - 1
+
+    # f[m][a]: cost of the best m knots after knot a; nxt[m][a]: the first of them
+    f = nxt = None
+    memo = PL_MEMO if n >= PL_MEMO_MIN else None
+    if memo is not None:
+        digest = array_digest(x, y)
+        fkey, nkey = (memo_key('PL_DP', digest, layers=layers, normalize=normalize, table=table)
+                      for table in ('f', 'nxt'))
+        f, nxt = memo.get(fkey), memo.get(nkey)
+    if f is None or nxt is None:
+        f = [np.zeros(n)]
+        nxt = [np.full(n, -1)]
+        for m in range(1, layers):
+            report_progress(done=m - 1, total=layers - 1)
+            fm = np.empty(n)
+            nm = np.empty(n, dtype=int)
+            kind = 'last' if m == 1 else 'middle'
+            for start, cost in costs.blocks(kind):
+                if m > 1:
+                    cost = cost + f[m - 1][None, :]
+                nm[start:start + len(cost)] = np.argmin(cost, axis=1)
+                fm[start:start + len(cost)] = np.min(cost, axis=1)
+            f.append(fm)
+            nxt.append(nm)
+        f, nxt = np.stack(f), np.stack(nxt)
+        if memo is not None:
+            memo.put(fkey, f)
+            memo.put(nkey, nxt)
+
+    result = {}
+    for k in ks:
+        best = math.inf
+        pair = None
+        kind = 'whole' if k == 2 else 'first'
+        for start, cost in costs.blocks(kind):
+            total = cost + f[k - 2][None, :]
+            t = int(np.argmin(total))
+            if total.flat[t] < best:
+                best = total.flat[t]
+                pair = (start + t // n, t % n)
+        if pair is None:
+            continue
+        sample = list(pair)
+        for m in range(k - 2, 0, -1):
+            sample.append(int(nxt[m][sample[-1]]))
+        result[k] = (sample, best)
+    return result
+
+def T_PL(D, n, evaluator, normalize='segment'):
     x = D['x'].reshape(-1, 1)
     y = D['y']
-    did = D['name']
-    if n==2:
-        return T(x, y)
-    minDist = math.inf
-    minx0 = -1
-    minx1 = -1
-    recnp = np.ones([len(x), len(x)]) * -1
-    recdist = np.ones([len(x), len(x)]) * -1
-    recnp_path = "storage/recnp%s.npy" % (did)
-    recdist_path = "storage/recdist%s.npy" % (did)
-    if os.path.isfile(recnp_path) and os.path.isfile(recdist_path):
-        recnp = np.load(recnp_path) #load from disk
-        recdist = np.load(recdist_path) #load from disk
-        # if recnp[prevx][n] != -1:
-        #     return recnp[prevx][n], recdist[prevx][n]
-    
-    for i in range(len(x)):
-        for j in range(i + 1, len(x)):
-            xcut = x[0:(j+1)]
-            ycut = y[0:(j+1)]
-            x_sample = np.array([x[i], x[j]])
-            y_sample = np.array([y[i], y[j]])
-            model = LinearRegression().fit(x_sample, y_sample)
-            ycut_predicted = model.predict(xcut)
-            distance = mean_squared_error(ycut, ycut_predicted)
-            fx, fdist = T_PLRecursion(x, y, j, n-2, recnp, recdist)
-            distance += fdist
-            if distance < minDist:
-                minDist = distance
-                minx0 = i
-                minx1 = j
-    
-    minSx = [x[minx0], x[minx1]]
-    minSy = [y[minx0], y[minx1]]
-    k = minx1
-    for i in range(n-2):
-        k = int(recnp[k][n-2-i])
-        minSx.append(x[k])
-        minSy.append(y[k])
-    
-    np.save("storage/recnp%s.npy" % (did),recnp) # save to disk
-    np.save("storage/recdist%s.npy" % (did), recdist) # save to disk
-    return [minSx, minSy], minDist
-
-# returns array of size n, containing indexes of x that results in min distance 
-def T_PLRecursion(x, y, prevx, n, recnp, recdist):
-    if n == 0: return -1, 0
-    if recnp[prevx][n] != -1:
-        return recnp[prevx][n], recdist[prevx][n]
-    minDist = math.inf
-    minSx = 0
-    xcut, ycut = [], []
-    for i in range(prevx + 1, len(x)):
-        if n == 1:
-            xcut = x[prevx+1:len(x)]
-            ycut = y[prevx+1:len(x)]
-        else:
-            xcut = x[prevx+1:(i+1)]
-            ycut = y[prevx+1:(i+1)]
-        x_sample = [x[prevx], x[i]]
-        y_sample = [y[prevx], y[i]]
-        model = LinearRegression().fit(x_sample, y_sample)
-        ycut_predicted = model.predict(xcut)
-        distance = mean_squared_error(ycut, ycut_predicted)
-        fx, fdist = T_PLRecursion(x, y, i, n-1, recnp, recdist)
-        distance += fdist
-        if distance < minDist:
-            minDist = distance
-            minSx = i
-    
-    recdist[prevx][n] = minDist
-    recnp[prevx][n] = minSx  
-    return minSx, minDist
+    if len(x) <= n:
+        # connecting every point fits them all
+        return [[x[i] for i in range(len(x))], [y[i] for i in range(len(x))]], 0.0
+    ladder = PL_DP(D, n, normalize=normalize, ks=[n])
+    if n not in ladder:
+        return [[],[]], math.inf
+    sample, minDist = ladder[n]
+    return [[x[i] for i in sample], [y[i] for i in sample]], minDist
 
 def T_PL7(D, H, evaluator):
     return T_PL(D, 7, evaluator)
 
-def T_GreedyConstruction(D, H, evaluator):
+"""
+Streaming "connect the dots" sampling for append-only series.
+
+The sample always ends at the newest point, so a forward dynamic program fits:
+cost[m][b] is the least squared error of m knots ending at point b over the
+points up to b, with back[m][b] the knot before b. append() only computes the
+column for the new point, O(k * n) from running sums without touching the data,
+and walks k back-pointers to rebuild the sample, which `sample` then returns in
+O(1). For a series that keeps its last point as a knot this is the same sample
+PL_DP finds with normalize='total'.
+
+window: keep only the last `window` points. The tables are rebuilt over the kept
+points every window/4 evictions, so an append costs O(k * window) amortised, and
+until then a first knot among the evicted points is moved to the oldest point
+kept. distance scores the sample with the evaluator over the kept points,
+computed on first access after a change.
+"""
+class StreamingSampler:
+    def __init__(self, H=None, evaluator=None, k=None, window=None):
+        H = H if H is not None else H_PL7
+        if not (isinstance(H, type) and issubclass(H, H_PL)):
+            raise Exception("StreamingSampler needs a piecewise-linear human")
+        self.H = H
+        self.evaluator = evaluator if evaluator is not None else E_MSE
+        self.k = k if k is not None else (H.window or 7)
+        self.window = window
+        self._reset(np.empty(0), np.empty(0))
+
+    def __len__(self):
+        return self.n - self.start
+
+    @property
+    def D(self):
+        return {'x': self.x[self.start:self.n], 'y': self.y[self.start:self.n], 'name': 'stream'}
+
+    @property
+    def distance(self):
+        if self._distance is None and self.n > self.start:
+            self._distance = self.evaluator(self.D, self.H(self.sample[0], self.sample[1]))
+        return self._distance
+
+    def extend(self, xs, ys):
+        for x, y in zip(np.asarray(xs, dtype=float).reshape(-1), np.asarray(ys, dtype=float).reshape(-1)):
+            self.append(x, y)
+
+    def append(self, x, y):
+        x, y = float(x), float(y)
+        if self.n > self.start and x < self.x[self.n - 1]:
+            raise Exception("Points must be appended in increasing x")
+        self._push(x, y)
+        if self.window is not None and len(self) > self.window:
+            self.start = self.n - self.window
+            if self.start >= max(1, self.window // 4):
+                self._reset(self.x[self.start:self.n], self.y[self.start:self.n])
+        self._update_sample()
+
+    def _reset(self, x, y):
+        # drop everything before x[0] and recompute the tables over x, y
+        size = max(64, 2 * len(x))
+        x, y = np.array(x), np.array(y)
+        self.x, self.y = np.empty(size), np.empty(size)
+        self.P = np.zeros((5, size + 1))  # running sums of x, y, xx, xy, yy, centered on the first point
+        self.cost = np.full((self.k + 1, size), math.inf)
+        self.back = np.zeros((self.k + 1, size), dtype=int)
+        self.x0, self.y0 = (x[0], y[0]) if len(x) else (0.0, 0.0)
+        self.n = self.start = 0
+        for xi, yi in zip(x, y):
+            self._push(xi, yi)
+        self._update_sample()
+
+    def _grow(self):
+        size = 2 * len(self.x)
+        self.x, self.y = np.resize(self.x, size), np.resize(self.y, size)
+        P = np.zeros((5, size + 1))
+        P[:, :self.n + 1] = self.P[:, :self.n + 1]
+        cost = np.full((self.k + 1, size), math.inf)
+        cost[:, :self.n] = self.cost[:, :self.n]
+        back = np.zeros((self.k + 1, size), dtype=int)
+        back[:, :self.n] = self.back[:, :self.n]
+        self.P, self.cost, self.back = P, cost, back
+
+    def _push(self, x, y):
+        if self.n == len(self.x):
+            self._grow()
+        b = self.n
+        self.x[b], self.y[b] = x, y
+        u, v = x - self.x0, y - self.y0
+        self.P[:, b + 1] = self.P[:, b] + (u, v, u * u, u * v, v * v)
+        self.n += 1
+        if b == 0:
+            return
+        xa, ya = self.x[:b] - self.x0, self.y[:b] - self.y0
+        # the first chord a -> b covers points 0..b, later chords a -> b cover a+1..b
+        first = _chord_sse(xa, ya, u, v, b + 1, *(self.P[:, b + 1] - self.P[:, 0]))
+        middle = _chord_sse(xa, ya, u, v, b - np.arange(b), *(self.P[:, b + 1, None] - self.P[:, 1:b + 1]))
+        self.back[2, b] = np.argmin(first)
+        self.cost[2, b] = first[self.back[2, b]]
+        for m in range(3, self.k + 1):
+            total = self.cost[m - 1, :b] + middle
+            self.back[m, b] = np.argmin(total)
+            self.cost[m, b] = total[self.back[m, b]]
+
+    def _update_sample(self):
+        b = self.n - 1
+        if self.n <= self.k:
+            knots = list(range(self.n))
+        else:
+            knots = [b]
+            for m in range(self.k, 1, -1):
+                b = int(self.back[m, b])
+                knots.append(b)
+            knots.reverse()
+        if knots and knots[0] < self.start:
+            knots = [self.start] + [p for p in knots if p > self.start]
+        self.knots = knots
+        self.sample = [self.x[knots], self.y[knots]]
+        self._distance = None
+
+"""
+Douglas-Peucker. The split tree does not depend on epsilon: a segment always
+splits at its farthest point, and epsilon only decides where the recursion stops.
+So the tree is walked once with an explicit stack. Each point gets the largest
+epsilon it survives, its distance to the chord it splits capped by its parent's
+threshold, since a point is only reached when its parent split. For any epsilon
+the simplification is then the points whose threshold exceeds it. For k points
+it is the k largest thresholds, ties going to the shallower point, so the result
+is always a valid Douglas-Peucker output. The endpoints never go.
+"""
+def douglas_peucker_thresholds(x, y):
+    x = np.asarray(x, dtype=float).reshape(-1)
+    y = np.asarray(y, dtype=float).reshape(-1)
+    n = len(x)
+    threshold = np.full(n, math.inf)
+    depth = np.zeros(n, dtype=int)
+    work = np.empty(max(n - 2, 0))
+    work2 = np.empty(max(n - 2, 0))
+    stack = [(0, n - 1, math.inf, 0)] if n > 2 else []
+    while stack:
+        a, b, cap, level = stack.pop()
+        if b - a < 2:
+            continue
+        # distance of a+1..b-1 to the line through a and b (to point a if they coincide)
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        norm = math.hypot(dx, dy)
+        d, e = work[:b - a - 1], work2[:b - a - 1]
+        np.subtract(x[a + 1:b], x[a], out=d)
+        np.subtract(y[a + 1:b], y[a], out=e)
+        if norm > 0:
+            d *= dy
+            e *= dx
+            d -= e
+            np.abs(d, out=d)
+            d /= norm
+        else:
+            np.hypot(d, e, out=d)
+        i = a + 1 + int(np.argmax(d))
+        t = min(d[i - a - 1], cap)
+        threshold[i] = t
+        depth[i] = level + 1
+        stack.append((i, b, t, level + 1))
+        stack.append((a, i, t, level + 1))
+    return threshold, depth
+
+def douglas_peucker(x, y, k=None, ratio=None, epsilon=None):
+    """
+    Indices (increasing) of the simplification keeping k points, ratio * n points
+    or the points farther than epsilon. Pass one of them.
+    """
+    threshold, depth = douglas_peucker_thresholds(x, y)
+    n = len(threshold)
+    if epsilon is not None:
+        return np.flatnonzero(threshold > epsilon)
+    if k is None:
+        k = round(ratio * n)
+    k = min(max(k, min(n, 2)), n)
+    order = np.lexsort((depth, -threshold))
+    return np.sort(order[:k])
+
+DP_K = 7
+
+def T_DouglasPeucker(D, H, evaluator, k=None, ratio=None, epsilon=None):
     x = D['x']
     y = D['y']
-    did = D['name']
-    x_sample_min = []
-    y_sample_min = []
-    minDist = math.inf
-    distance = math.inf
-    index = 0
+    if k is None and ratio is None and epsilon is None:
+        k = DP_K
+    index = douglas_peucker(x, y, k, ratio, epsilon)
+    if len(index) == 0:
+        return [[],[]], math.inf
+    sample = [x[index], y[index]]
+    return sample, evaluator(D, H(sample[0], sample[1]))
+
+"""
+A sample of D's points held as indices, for teachers that add and remove points
+one at a time.
 
-    pool = set(range(len(x)))
+The sample's indices, x and y live in buffers preallocated to len(D) and kept in
+(x, y) order, so add/remove shift at most the sample in place and sample()
+returns views of x and y ready to score, without sorting. `member` is a bitmap of
+the points in the sample; pool[:pool_size] holds the others in no particular
+order, and a point leaves or rejoins it by swapping with the pool's last entry.
+Points are told apart by index, so repeated x values are fine. The views change
+with the sample: copy() is what to keep.
+"""
+class SampleBuffer:
+    def __init__(self, D):
+        self.x = np.asarray(D['x']).reshape(-1)
+        self.y = np.asarray(D['y']).reshape(-1)
+        n = len(self.x)
+        self.rank = np.empty(n, dtype=np.intp)
+        self.rank[np.lexsort((self.y, self.x))] = np.arange(n)
+        self.index = np.empty(n, dtype=np.intp)
+        self.ranks = np.empty(n, dtype=np.intp)
+        self.xs = np.empty(n, dtype=self.x.dtype)
+        self.ys = np.empty(n, dtype=self.y.dtype)
+        self.size = 0
+        self.member = np.zeros(n, dtype=bool)
+        self.pool = np.arange(n)
+        self.where = np.arange(n)  # position of each point in pool
+        self.pool_size = n
+
+    def insert(self, i):
+        # put point i in the sample, leaving the pool alone (for trial moves)
+        pos = np.searchsorted(self.ranks[:self.size], self.rank[i])
+        for buf, v in ((self.index, i), (self.ranks, self.rank[i]), (self.xs, self.x[i]), (self.ys, self.y[i])):
+            buf[pos + 1:self.size + 1] = buf[pos:self.size]
+            buf[pos] = v
+        self.size += 1
+        self.member[i] = True
+
+    def remove(self, i):
+        pos = np.searchsorted(self.ranks[:self.size], self.rank[i])
+        for buf in (self.index, self.ranks, self.xs, self.ys):
+            buf[pos:self.size - 1] = buf[pos + 1:self.size]
+        self.size -= 1
+        self.member[i] = False
+
+    def _swap(self, i, p):
+        j = self.pool[p]
+        q = self.where[i]
+        self.pool[p], self.pool[q] = i, j
+        self.where[i], self.where[j] = p, q
+
+    def add(self, i):
+        self.insert(i)
+        self.pool_size -= 1
+        self._swap(i, self.pool_size)
+
+    def drop(self, i):
+        self.remove(i)
+        self._swap(i, self.pool_size)
+        self.pool_size += 1
+
+    def sample(self):
+        return self.xs[:self.size], self.ys[:self.size]
+
+    def copy(self):
+        return [self.xs[:self.size].copy(), self.ys[:self.size].copy()]
+
+"""
+score(x, y) returns the distance of the sample (x, y) and commit(x, y) makes it
+the sample later moves are made from. When both the human and the evaluator
+support incremental evaluation, a move only costs the part of D it affects.
+"""
+def _scorer(D, H, evaluator):
+    if hasattr(H, 'incremental') and hasattr(evaluator, 'incremental'):
+        state = H.incremental(D, evaluator)
+        return state.score, state.commit
+    score = lambda x_sample, y_sample: evaluator(D, H(x_sample, y_sample))
+    return score, lambda x_sample, y_sample: None
+
+# grows a SampleBuffer by the point that improves the distance most (the first such
+# point in D on ties) until no point improves it
+def _greedy_construction(D, H, evaluator):
+    sample = SampleBuffer(D)
+    score, commit = _scorer(D, H, evaluator)
+    minDist = math.inf
 
     while True:
-        x_sample_min = np.append(x_sample_min, 0)
-        y_sample_min = np.append(y_sample_min, 0)
-        for i in pool:
-            x_sample_min[len(x_sample_min)-1] = x[i]
-            y_sample_min[len(y_sample_min)-1] = y[i]
-            x_sample_sorted = [x for x,_ in sorted(zip(x_sample_min,y_sample_min))]
-            y_sample_sorted = [x for _,x in sorted(zip(x_sample_min,y_sample_min))]
-            human = H(x_sample_sorted, y_sample_sorted)
-            distance_curr = evaluator(D, human)
+        distance = math.inf
+        index = 0
+        for i in range(len(sample.x)):
+            if sample.member[i]:
+                continue
+            with section('SampleBuffer'):
+                sample.insert(i)
+            distance_curr = score(*sample.sample())
+            with section('SampleBuffer'):
+                sample.remove(i)
             if (distance_curr < distance):
                 distance = distance_curr
                 index = i
         if (distance >= minDist):
-            x_sample_min = np.delete(x_sample_min,-1)
-            y_sample_min = np.delete(y_sample_min,-1)
             break
         minDist = distance
-        distance = math.inf
-        x_sample_min[len(x_sample_min)-1] = x[index]
-        y_sample_min[len(y_sample_min)-1] = y[index]
-        pool.remove(index)
+        sample.add(index)
+        commit(*sample.sample())
+        report_progress(minDist, sample.copy(), done=sample.size)
+    return sample, minDist
 
-    x_sample_sorted = [x for x,_ in sorted(zip(x_sample_min,y_sample_min))]
-    y_sample_sorted = [x for _,x in sorted(zip(x_sample_min,y_sample_min))]
-
-    return [x_sample_sorted, y_sample_sorted], minDist
+def T_GreedyConstruction(D, H, evaluator):
+    sample, minDist = _greedy_construction(D, H, evaluator)
+    return sample.copy(), minDist
 
-def T_HillClimbing(D, H, evaluator):
-    x = D['x']
-    y = D['y']
-    did = D['name']
-    table = {}
-    for i in range(len(x)):
-        table[x[i]] = y[i]
-        
-    sample, minDist = T_GreedyConstruction(D, H, evaluator)
-    x_sample = sample[0]
-    y_sample = sample[1]
-    x_sample_min = x_sample
-    y_sample_min = y_sample
-        
-    x_pool = x
-    for sx in range(len(x_sample)):
-        x_pool = x_pool[x_pool != sx]
-        
-    distance = math.inf
-    index = 0
+"""
+Random local search on a SampleBuffer: each move adds a random point (1/3), removes
+a random one (1/3, only from samples of more than 2) or does both, and is kept
+when it lowers the distance. Stops after 100 moves in a row fail, or at deadline.
+rnd: source of random numbers (random or a random.Random)
+"""
+def _hill_climb(sample, score, commit, minDist, rnd, deadline=None, progress=False):
     tries = 0
     while tries < 100:
-        x_temp = x_sample
-        y_temp = y_sample
-
-        rng = random.random()
-        x_added = -1
-        x_removed = -1
-        # add one element or remove one element or change one element
-        if rng < 1/3 or rng > 2/3:
-            x_added = x_pool[int(random.random()*len(x_pool))]
-            x_pool = x_pool[x_pool != x_added]
-            x_temp = np.append(x_temp, x_added)
-            y_temp = np.append(y_temp, table[x_added])
-        if 1/3 < rng and len(x_sample) > 2:
-            x_removed = x_sample[int(random.random()*len(x_sample))]
-            x_temp = np.delete(x_temp, np.argwhere(x_temp == x_removed))
-            y_temp = np.delete(y_temp, np.argwhere(y_temp == table[x_removed]))
-            x_pool = np.append(x_pool, x_removed)
-
-
-        x_temp_sorted = [i for i,_ in sorted(zip(x_temp,y_temp))]
-        y_temp_sorted = [j for _,j in sorted(zip(x_temp,y_temp))]
-
-        human = H(x_temp_sorted, y_temp_sorted)
-        distance_curr = evaluator(D, human)
+        if deadline is not None and time.time() > deadline:
+            break
+        report_progress()
+        rng = rnd.random()
+        added = removed = None
+        # the point to remove is drawn from the sample before the addition
+        size = sample.size
+        if (rng < 1/3 or rng > 2/3) and sample.pool_size:
+            added = sample.pool[int(rnd.random()*sample.pool_size)]
+        if 1/3 < rng and size > 2:
+            removed = sample.index[int(rnd.random()*size)]
+        with section('SampleBuffer'):
+            if added is not None:
+                sample.add(added)
+            if removed is not None:
+                sample.drop(removed)
+
+        distance_curr = score(*sample.sample())
         if (distance_curr < minDist):
             minDist = distance_curr
-            x_sample = x_temp_sorted
-            y_sample = y_temp_sorted
+            commit(*sample.sample())
+            if progress:
+                report_progress(minDist, sample.copy())
             tries = 0
         else:
-            if x_added != -1:
-                x_pool = np.append(x_pool, x_added)
-            if x_removed != -1:
-                x_pool = x_pool[x_pool != x_removed]
+            with section('SampleBuffer'):
+                if removed is not None:
+                    sample.add(removed)
+                if added is not None:
+                    sample.drop(added)
             tries += 1
-    return [x_sample, y_sample], minDist
+    return minDist
 
-def T_HillClimbingRestart(D, H, evaluator):
-    x = D['x']
-    y = D['y']
-    did = D['name']
-    table = {}
-    for i in range(len(x)):
-        table[x[i]] = y[i]
-        
-    x_sample_min = None
-    y_sample_min = None
+def T_HillClimbing(D, H, evaluator):
+    sample, minDist = _greedy_construction(D, H, evaluator)
+    score, commit = _scorer(D, H, evaluator)
+    commit(*sample.sample())
+    minDist = _hill_climb(sample, score, commit, minDist, random, progress=True)
+    return sample.copy(), minDist
 
-    minDistGlobal = math.inf
-    for k in range(100):
-        x_sample = []
-        y_sample = []
-        
-        for u in range(len(x)):
-            index_sample = random.sample(range(len(x)), 7)
-            x_sample = x[index_sample]
-            y_sample = y[index_sample]
-        minDist = math.inf
-        x_pool = x
-        for sx in range(len(x_sample)):
-            x_pool = x_pool[x_pool != sx]
-        tries = 0
-        while tries < 100:
-            x_temp = x_sample
-            y_temp = y_sample
-
-            rng = random.random()
-            x_added = -1
-            x_removed = -1
-            # add one element or remove one element or change one element
-            if rng < 1/3 or rng > 2/3:
-                x_added = x_pool[int(random.random()*len(x_pool))]
-                x_pool = x_pool[x_pool != x_added]
-                x_temp = np.append(x_temp, x_added)
-                y_temp = np.append(y_temp, table[x_added])
-            if 1/3 < rng and len(x_sample) > 2:
-                x_removed = x_sample[int(random.random()*len(x_sample))]
-                x_temp = np.delete(x_temp, np.argwhere(x_temp == x_removed))
-                y_temp = np.delete(y_temp, np.argwhere(y_temp == table[x_removed]))
-                x_pool = np.append(x_pool, x_removed)
-
-            sample_sorted = sorted(zip(x_temp,y_temp))
-            x_temp_sorted = [i for i,_ in sample_sorted]
-            y_temp_sorted = [j for _,j in sample_sorted]
-
-            human = H(x_temp_sorted, y_temp_sorted)
-            distance_curr = evaluator(D, human)
-            if (distance_curr < minDist):
-                minDist = distance_curr
-                x_sample = x_temp_sorted
-                y_sample = y_temp_sorted
-                tries = 0
+# one hill climbing run from a random 7-point sample, drawing only from its own seeded generator
+def _hill_climb_from_random(D, H, evaluator, seed, deadline=None):
+    rnd = random.Random(seed)
+    score, commit = _scorer(D, H, evaluator)
+    sample = SampleBuffer(D)
+    for i in rnd.sample(range(len(sample.x)), min(7, len(sample.x))):
+        sample.add(i)
+    minDist = _hill_climb(sample, score, commit, math.inf, rnd, deadline)
+    if minDist == math.inf:
+        # the deadline passed before the first move; the random start is the result
+        minDist = evaluator(D, H(*sample.sample()))
+    return sample.copy(), minDist
+
+"""
+restarts: number of independent hill climbing runs
+workers: processes to spread the restarts over (1 runs them in this process)
+seed: master seed; restart r always gets the same derived seed, so the result for
+      a given seed does not depend on `workers`
+target: stop once a restart reaches this distance
+time_budget: seconds of wall-clock time; running restarts stop climbing and
+             restarts not started yet are dropped when it expires
+Ties between restarts go to the lower restart number. The first restart always
+runs (with the budget already spent it returns its random start), so there is a
+sample to return.
+"""
+def T_HillClimbingRestart(D, H, evaluator, restarts=100, workers=1, seed=None, target=None, time_budget=None):
+    if restarts < 1:
+        raise Exception("Invalid restarts")
+    master = random.Random(seed)
+    seeds = [master.getrandbits(64) for _ in range(restarts)]
+    deadline = time.time() + time_budget if time_budget is not None else None
+
+    best = (math.inf, restarts, None)
+    def done():
+        return (target is not None and best[0] <= target) or (deadline is not None and time.time() > deadline)
+
+    if workers is None or workers <= 1:
+        for r in range(restarts):
+            if r > 0 and done():
+                break
+            sample, minDist = _hill_climb_from_random(D, H, evaluator, seeds[r], deadline)
+            best = min(best, (minDist, r, sample), key=lambda b: b[:2])
+            report_progress(best[0], best[2], done=r + 1, total=restarts)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {executor.submit(_hill_climb_from_random, D, H, evaluator, seeds[r], deadline): r
+                       for r in range(restarts)}
+            finished = 0
+            for future in as_completed(futures):
+                sample, minDist = future.result()
+                best = min(best, (minDist, futures[future], sample), key=lambda b: b[:2])
+                finished += 1
+                report_progress(best[0], best[2], done=finished, total=restarts)
+                if done():
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    minDistGlobal, _, sample = best
+    return sample, minDistGlobal
+
+"""
+Beam search over samples of D's points.
+
+Samples grow one point at a time from the empty sample. Each round expands every
+sample in the beam by every point it does not have; a sample reached from
+several parents is scored once. The whole frontier is scored in batches of
+BEAM_CELLS predictions through H.batch_predict and evaluator.batch (falling back
+to one H and evaluator call per sample when they have none), and the `width`
+best samples form the next beam. Progress is reported after every batch, so a
+deadline or cancellation stops the search within one batch.
+
+Against T_GreedyConstruction the batches pay off for H_OLS and H_quad, whose
+greedy moves are each a full fit (on co2Emissions, 261 points, beam search takes
+half greedy's time for the same sample). H_PL's greedy moves are scored
+incrementally, so there beam search is the slower one, 2-6x greedy's time on
+the series in data/, for a sample 2-4x closer.
+
+width: samples kept per round
+size: sample size to build; the best sample of that size is returned. By
+      default the search stops after `patience` rounds in a row whose best
+      sample does not beat the best so far, and returns that best (width=1,
+      patience=1 is T_GreedyConstruction, scored in batches)
+time_budget: seconds; when they run out the search stops within the current
+             batch and returns the best sample so far (with `size`, the best
+             of the last round)
+ladder: optional dict, filled with {m: (indices into D, distance)} of the best
+        sample of each round m (see sample_ladder)
+"""
+BEAM_WIDTH = 8
+BEAM_PATIENCE = 2
+BEAM_CELLS = 1 << 22
+
+def _batch_scorer(D, H, evaluator):
+    # distances of the samples in the rows of X, Y
+    x = np.asarray(D['x']).reshape(-1)
+    if hasattr(H, 'batch_predict') and hasattr(evaluator, 'batch'):
+        return lambda X, Y: evaluator.batch(D, H.batch_predict(X, Y, x))
+    return lambda X, Y: np.array([evaluator(D, H(Xi, Yi)) for Xi, Yi in zip(X, Y)])
+
+def T_BeamSearch(D, H, evaluator, width=BEAM_WIDTH, size=None, time_budget=None, patience=BEAM_PATIENCE,
+                 ladder=None):
+    x = np.asarray(D['x']).reshape(-1)
+    y = np.asarray(D['y']).reshape(-1)
+    n = len(x)
+    # beam samples are rows of increasing indices into D in (x, y) order
+    order = np.lexsort((y, x))
+    xs, ys = x[order], y[order]
+    score = _batch_scorer(D, H, evaluator)
+    deadline = time.time() + time_budget if time_budget is not None else None
+    rows = max(1, BEAM_CELLS // max(n, 1))
+    last = n if size is None else min(size, n)
+
+    beam = np.empty((1, 0), dtype=np.intp)
+    best, bestSample = math.inf, None
+    stale = 0
+    for m in range(1, last + 1):
+        free = np.ones((len(beam), n), dtype=bool)
+        np.put_along_axis(free, beam, False, axis=1)
+        parent, point = np.nonzero(free)
+        frontier = np.unique(np.sort(np.column_stack([beam[parent], point]), axis=1), axis=0)
+        distances = np.full(len(frontier), math.inf)
+        expired = False
+        for start in range(0, len(frontier), rows):
+            block = frontier[start:start + rows]
+            distances[start:start + rows] = score(xs[block], ys[block])
+            # per block, so a deadline or cancellation need not wait for the round
+            report_progress(done=m - 1, total=size)
+            if deadline is not None and time.time() > deadline:
+                expired = True
+                break
+        keep = np.argsort(distances, kind='stable')[:width]
+        keep = keep[np.isfinite(distances[keep])]
+        if len(keep) == 0:
+            break
+        beam = frontier[keep]
+        if ladder is not None:
+            ladder[m] = (order[beam[0]], float(distances[keep[0]]))
+        if distances[keep[0]] < best or size is not None:
+            best, bestSample = distances[keep[0]], beam[0]
+            stale = 0
+        else:
+            stale += 1
+        report_progress(best, [xs[bestSample], ys[bestSample]], done=m, total=size)
+        if expired or stale >= patience:
+            break
+
+    if bestSample is None:
+        return [[],[]], math.inf
+    sample = [xs[bestSample], ys[bestSample]]
+    return sample, evaluator(D, H(sample[0], sample[1]))
+
+def _square_range(lo, hi):
+    # (min, max) of t^2 over lo <= t <= hi
+    return (0.0 if lo <= 0 <= hi else min(lo * lo, hi * hi)), max(lo * lo, hi * hi)
+
+class Extrema(Evaluator):
+    def distance(self, P, predicted):
+        return (P.ymax - predicted.max(axis=-1)) ** 2 + (P.ymin - predicted.min(axis=-1)) ** 2
+
+    def incremental(self, D, stats):
+        return (stats.ymax - stats.pmax) ** 2 + (stats.ymin - stats.pmin) ** 2
+
+    def coarse(self, D, stats):
+        top = _square_range(stats.ymax - stats.pmax[1], stats.ymax - stats.pmax[0])
+        bottom = _square_range(stats.ymin - stats.pmin[1], stats.ymin - stats.pmin[0])
+        return top[0] + bottom[0], top[1] + bottom[1]
+
+E_extrema = named('E_extrema', Extrema())
+E_MSE_extrema = named('E_MSE_extrema', MSE() + 10 * Extrema())
+
+"""
+Scheduler teacher: for E_MSE, which the exact (white-box) teachers minimise,
+runs the exact teacher for H when its estimated cost fits in `budget` seconds,
+else the exact teacher on as many evenly spaced points of D as fit. Other
+evaluators, and humans without an exact teacher, get greedy construction. The
+sample is always scored by `evaluator` on all of D.
+
+Costs are estimated as a * n**p seconds with the constants below, fitted to
+bench.py sweep timings; re-fit them when the teachers or the hardware change.
+
+info: optional dict, filled with the strategy used ('exact', 'downsampled' or
+      'greedy'), the teacher, the number of points it saw, the estimated and
+      actual seconds and the optimality gap when known. For E_MSE the gap is 0
+      for an exact T_OLS2/T_quad3 run whose own objective agrees with the
+      evaluator's score under H; otherwise (downsampled, or H fitting the sample
+      differently) it is an upper bound: the distance minus the MSE of H fitted
+      to all of D, which no sample beats.
+"""
+AUTO_BUDGET = 1.0
+AUTO_MIN_POINTS = 50
+AUTO_EXACT = {'H_OLS': 'T_OLS2', 'H_quad': 'T_quad3', 'H_PL7': 'T_PL7'}
+# teacher -> (a, p); greedy depends on whether moves are scored incrementally, and
+# without that costs about (sample size) * n**2, taken here for samples of ~50 points
+AUTO_COST = {
+    'T_OLS2': (5e-8, 2),
+    'T_quad3': (2e-8, 3),
+    'T_PL7': (2e-7, 2),
+    'T_GreedyConstruction': (5e-4, 1),
+    'T_GreedyConstructionFull': (1.5e-5, 2),
+}
+# the teachers that minimise E_MSE exactly over samples of their size
+AUTO_EXACT_MSE = ('T_OLS2', 'T_quad3')
+
+def _auto_teacher(H, evaluator):
+    # the exact teachers minimise MSE, so they are only the right teacher for E_MSE
+    if getattr(evaluator, '__name__', None) != 'E_MSE':
+        return 'T_GreedyConstruction'
+    return AUTO_EXACT.get(getattr(H, '__name__', None), 'T_GreedyConstruction')
+
+def _auto_model(teacher, H, evaluator):
+    if teacher == 'T_GreedyConstruction' and not (hasattr(H, 'incremental') and hasattr(evaluator, 'incremental')):
+        return AUTO_COST['T_GreedyConstructionFull']
+    return AUTO_COST[teacher]
+
+def _auto_points(model, budget, n):
+    # largest number of points the teacher gets through in `budget` seconds
+    a, p = model
+    return min(n, int((budget / a) ** (1 / p)))
+
+def _downsample(D, m):
+    index = np.unique(np.round(np.linspace(0, len(D['x']) - 1, m)).astype(int))
+    return {'x': D['x'][index], 'y': D['y'][index], 'name': D['name']}
+
+def T_Auto(D, H, evaluator, budget=AUTO_BUDGET, info=None):
+    n = len(D['x'])
+    teacher = _auto_teacher(H, evaluator)
+    model = _auto_model(teacher, H, evaluator)
+    m = _auto_points(model, budget, n)
+    if m >= n:
+        strategy = 'exact' if teacher in AUTO_EXACT.values() else 'greedy'
+    elif teacher in AUTO_EXACT.values() and m >= AUTO_MIN_POINTS:
+        strategy = 'downsampled'
+    else:
+        teacher = 'T_GreedyConstruction'
+        model = _auto_model(teacher, H, evaluator)
+        m = max(min(n, AUTO_MIN_POINTS), _auto_points(model, budget, n))
+        strategy = 'greedy'
+
+    start = time.perf_counter()
+    sample, own = globals()[teacher](D if m >= n else prepare(_downsample(D, m)), H, evaluator)
+    seconds = time.perf_counter() - start
+    # downsampled distances are over the subset, T_PL7's over its own objective
+    minDist = evaluator(D, H(sample[0], sample[1])) if len(sample[0]) else math.inf
+
+    gap = None
+    if teacher in AUTO_EXACT_MSE:
+        # optimal only if the teacher's objective is what H and the evaluator score
+        if m >= n and math.isclose(own, minDist, rel_tol=1e-9, abs_tol=1e-12):
+            gap = 0.0
+        else:
+            gap = max(0.0, minDist - evaluator(D, H(D['x'].reshape(-1, 1), D['y'])))
+    if info is not None:
+        info.update({'strategy': strategy, 'teacher': teacher, 'n': n, 'points': m, 'budget': budget,
+                     'estimate': model[0] * m ** model[1], 'seconds': seconds, 'gap': gap})
+    return sample, minDist
+
+"""
+Multi-resolution summary of a series for evaluating samples without visiting
+every point.
+
+Level j of a Pyramid cuts D (in x order) into buckets of fanout**(j+1)
+consecutive points and keeps each bucket's count, sums of x, y, x^2, xy and y^2,
+first and last x and least and greatest y; each level is built from the one below
+it. stats(model, level) summarises a model against one level in O(buckets): the
+model is replaced on each bucket by its chord between the bucket's first and last
+x, whose squared error follows exactly from the sums. A model's
+deviation(lo, hi) says how far it can stray from that chord (0 for a line, and
+for H_PL on buckets without a knot inside); by the triangle inequality the
+bucket's true error is then within (sqrt(chord error) +- deviation *
+sqrt(count))^2, and its predictions within deviation of the chord's extremes.
+Buckets where the deviation is unknown or infinite (a knot inside, or a model
+without deviation()) are evaluated on their points. So the result holds
+intervals, CoarseStats, which evaluators turn into (lower, upper) bounds on the
+distance through their `coarse` form; for H_OLS and H_PL both bounds are the
+exact distance.
+"""
+PYRAMID_FANOUT = 8
+PyramidLevel = namedtuple('PyramidLevel', ['size', 'start', 'count', 'sums', 'xlo', 'xhi', 'ymin', 'ymax'])
+# sse, pmin and pmax are (lower, upper) intervals
+CoarseStats = namedtuple('CoarseStats', ['n', 'sse', 'pmin', 'pmax', 'ymin', 'ymax'])
+
+class Pyramid:
+    def __init__(self, D, fanout=PYRAMID_FANOUT):
+        x = np.asarray(D['x'], dtype=float).reshape(-1)
+        y = np.asarray(D['y'], dtype=float).reshape(-1)
+        if np.any(x[1:] < x[:-1]):
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        self.x, self.y = x, y
+        self.n = len(x)
+        self.fanout = fanout
+        # sums are of centered data, which keeps the chord expansion from cancelling
+        self.x0, self.y0 = x.mean(), y.mean()
+        xc, yc = x - self.x0, y - self.y0
+        self.ymin, self.ymax = y.min(), y.max()
+
+        start = np.arange(0, self.n, fanout)
+        sums = np.add.reduceat(np.stack([np.ones(self.n), xc, yc, xc * xc, xc * yc, yc * yc]), start, axis=1)
+        last = np.minimum(start + fanout, self.n) - 1
+        level = PyramidLevel(fanout, start, sums[0].astype(int), sums[1:], x[start], x[last],
+                             np.minimum.reduceat(y, start), np.maximum.reduceat(y, start))
+        self.levels = [level]
+        while len(level.start) > 1:
+            first = np.arange(0, len(level.start), fanout)
+            last = np.minimum(first + fanout, len(level.start)) - 1
+            level = PyramidLevel(level.size * fanout, level.start[first], np.add.reduceat(level.count, first),
+                                 np.add.reduceat(level.sums, first, axis=1), level.xlo[first], level.xhi[last],
+                                 np.minimum.reduceat(level.ymin, first), np.maximum.reduceat(level.ymax, first))
+            self.levels.append(level)
+
+    def level(self, buckets):
+        # the finest level with at most `buckets` buckets
+        for j, level in enumerate(self.levels):
+            if len(level.start) <= buckets:
+                return j
+        return len(self.levels) - 1
+
+    def means(self, j):
+        # a dataset of the bucket means of level j
+        level = self.levels[j]
+        return {'x': level.sums[0] / level.count + self.x0, 'y': level.sums[1] / level.count + self.y0}
+
+    def nearest(self, j, bucket, x):
+        # the point of a bucket of level j closest to x (by position in x order)
+        level = self.levels[j]
+        lo, hi = level.start[bucket], level.start[bucket] + level.count[bucket] - 1
+        return np.clip(np.searchsorted(self.x, x), lo, hi)
+
+    def stats(self, model, j):
+        level = self.levels[j]
+        plo = model.predict(level.xlo)
+        phi = model.predict(level.xhi)
+        deviation = model.deviation(level.xlo, level.xhi) if hasattr(model, 'deviation') else \
+            np.full(len(level.start), math.inf)
+        raw = ~np.isfinite(deviation)
+        fit = ~raw
+
+        cnt = level.count[fit]
+        chord = _chord_sse(level.xlo[fit] - self.x0, plo[fit] - self.y0, level.xhi[fit] - self.x0,
+                           phi[fit] - self.y0, cnt, *level.sums[:, fit])
+        spread = deviation[fit] * np.sqrt(cnt)
+        root = np.sqrt(chord)
+        sse = [np.sum(np.maximum(root - spread, 0) ** 2), np.sum((root + spread) ** 2)]
+        low, high = np.minimum(plo, phi)[fit], np.maximum(plo, phi)[fit]
+        # the chord ends are data points, so its extremes are attained
+        pmin = [np.min(low - deviation[fit], initial=math.inf), np.min(low, initial=math.inf)]
+        pmax = [np.max(high, initial=-math.inf), np.max(high + deviation[fit], initial=-math.inf)]
+
+        if raw.any():
+            counts = level.count[raw]
+            offsets = level.start[raw] - np.cumsum(counts) + counts
+            index = np.repeat(offsets, counts) + np.arange(counts.sum())
+            predicted = model.predict(self.x[index])
+            exact = np.sum((self.y[index] - predicted) ** 2)
+            sse = [sse[0] + exact, sse[1] + exact]
+            pmin = [min(pmin[0], predicted.min()), min(pmin[1], predicted.min())]
+            pmax = [max(pmax[0], predicted.max()), max(pmax[1], predicted.max())]
+        return CoarseStats(self.n, tuple(sse), tuple(pmin), tuple(pmax), self.ymin, self.ymax)
+
+"""
+Coarse-to-fine teacher for long series.
+
+The teacher T_Auto picks for H and the evaluator (the exact teacher for E_MSE,
+greedy construction for other evaluators and humans) solves the problem on the bucket means of the finest pyramid level with
+at most `coarse` buckets (PYRAMID_COARSE by default). Each sample point is then
+moved to the data point of its bucket nearest the mean, and refined by pattern
+search: every point tries moving `step` points left and right, keeping what
+improves the distance, with step halving from half a bucket down to 1. Moves are
+scored by the midpoint of the evaluator's coarse bounds on the pyramid level
+whose buckets are no wider than the step (and not finer than sqrt(n) points),
+or by the evaluator on all of D when it has no coarse form. The sample returned
+is scored on all of D. On series of at most `coarse` points the teacher runs as
+is.
+
+info: optional dict, filled with the coarse teacher, the bucket size it saw,
+      the number of refinement moves scored and the distance before refinement.
+"""
+PYRAMID_COARSE = {'T_OLS2': 2048, 'T_quad3': 256, 'T_PL7': 1024, 'T_GreedyConstruction': 256}
+PYRAMID_SWEEPS = 8
+
+def T_Pyramid(D, H, evaluator, coarse=None, fanout=PYRAMID_FANOUT, info=None):
+    n = len(D['x'])
+    teacher = _auto_teacher(H, evaluator)
+    coarse = coarse or PYRAMID_COARSE[teacher]
+    if n <= coarse:
+        sample, minDist = globals()[teacher](D, H, evaluator)
+        # the exact teachers' distances are their own objective, not the evaluator's
+        minDist = evaluator(D, H(sample[0], sample[1])) if len(sample[0]) else math.inf
+        if info is not None:
+            info.update({'teacher': teacher, 'bucket': 1, 'moves': 0, 'coarse_distance': float(minDist)})
+        return sample, minDist
+
+    pyramid = Pyramid(D, fanout)
+    x, y = pyramid.x, pyramid.y
+    j = pyramid.level(coarse)
+    means = pyramid.means(j)
+    with section('coarse'):
+        sample, _ = globals()[teacher](prepare(dict(means, name=D.get('name'))), H, evaluator)
+    sx = np.unique(np.ravel(np.asarray(sample[0], dtype=float)))
+    if len(sx) == 0:
+        return [[],[]], math.inf
+    buckets = np.searchsorted(means['x'], sx)
+    index = np.unique([pyramid.nearest(j, b, v) for b, v in zip(buckets, sx)])
+
+    coarseEval = getattr(evaluator, 'coarse', None)
+    floor = math.isqrt(n)
+    moves = 0
+
+    def score(index, step):
+        model = H(x[index], y[index])
+        if coarseEval is None:
+            return evaluator(D, model)
+        fine = [k for k, level in enumerate(pyramid.levels) if level.size <= max(step, floor)]
+        lower, upper = coarseEval(D, pyramid.stats(model, fine[-1] if fine else 0))
+        return (lower + upper) / 2
+
+    step = max(1, pyramid.levels[j].size // 2)
+    steps = step.bit_length()
+    coarseDist = None
+    while True:
+        # a finer step may score on a finer level, so the incumbent is rescored
+        best = score(index, step)
+        if coarseDist is None:
+            coarseDist = best
+        report_progress(distance=best, done=steps - step.bit_length(), total=steps)
+        for _ in range(PYRAMID_SWEEPS):
+            improved = False
+            for i in range(len(index)):
+                for move in (-step, step):
+                    c = index[i] + move
+                    if c < (index[i - 1] + 1 if i > 0 else 0) or c > (index[i + 1] - 1 if i + 1 < len(index) else n - 1):
+                        continue
+                    candidate = index.copy()
+                    candidate[i] = c
+                    distance = score(candidate, step)
+                    moves += 1
+                    if distance < best:
+                        best, index, improved = distance, candidate, True
+            if not improved:
+                break
+        if step == 1:
+            break
+        step //= 2
+
+    sample = [x[index], y[index]]
+    minDist = evaluator(D, H(sample[0], sample[1]))
+    if info is not None:
+        info.update({'teacher': teacher, 'bucket': int(pyramid.levels[j].size), 'moves': moves,
+                     'coarse_distance': float(coarseDist)})
+    return sample, minDist
+
+"""
+Sample ladders: the best known sample of every size.
+
+sample_ladder() returns {k: (indices into D, distance)} for every k <= K, the
+form PL_DP returns. One T_BeamSearch sweep with size=K gives the best sample of
+each round, and the exact teachers add theirs where H fits them (T_OLS2 for 2
+points, T_quad3 for 3, PL_DP for every k) and AUTO_COST puts them within
+`budget` seconds (LADDER_EXACT_BUDGET, for ladders.py offline). Each candidate is scored with the evaluator and the
+better one kept, so the sizes the exact teachers cover are at least as good as
+theirs (optimal for E_MSE, up to how far H's own fit departs from theirs) and the
+rest best known. ladders.py precomputes ladders for the registered datasets
+(see ladderIndex.py).
+
+pick_rung(ladder, k, distance) chooses (k, indices, distance) from a ladder: the
+sample of size k, or the smallest sample within `distance` (the least distant
+one when none is), or with neither the least distant of all; None when the
+ladder has no such size or no rungs.
+"""
+LADDER_K = 10
+LADDER_EXACT_BUDGET = 60.0
+
+def _sample_index(D, sample):
+    # indices into D of the sample's points
+    x = np.asarray(D['x']).reshape(-1)
+    y = np.asarray(D['y']).reshape(-1)
+    return np.array([np.flatnonzero((x == sx) & (y == sy))[0]
+                     for sx, sy in zip(np.ravel(sample[0]), np.ravel(sample[1]))], dtype=np.intp)
+
+def sample_ladder(D, H, evaluator, K=LADDER_K, budget=LADDER_EXACT_BUDGET):
+    D = prepare(D)
+    x = np.asarray(D['x']).reshape(-1)
+    y = np.asarray(D['y']).reshape(-1)
+    n = len(x)
+    ladder = {}
+
+    def offer(index):
+        index = np.asarray(index, dtype=np.intp)
+        k = len(index)
+        if not 1 <= k <= K:
+            return
+        distance = float(evaluator(D, H(x[index], y[index])))
+        if k not in ladder or distance < ladder[k][1]:
+            ladder[k] = (index, distance)
+
+    # the teachers below report samples of other sizes, so only their progress is passed on
+    outer = _progress.get()
+    def forward(distance=None, sample=None, done=None, total=None):
+        if outer is not None:
+            outer(done=done, total=total)
+
+    with progress_scope(forward):
+        rounds = {}
+        T_BeamSearch(D, H, evaluator, size=K, ladder=rounds)
+        for index, _ in rounds.values():
+            offer(index)
+
+        teacher = AUTO_EXACT.get(getattr(H, '__name__', None))
+        if teacher is not None and _auto_points(AUTO_COST[teacher], budget, n) >= n:
+            if teacher == 'T_PL7':
+                for index, _ in PL_DP(D, K, normalize='total').values():
+                    offer(index)
             else:
-                if x_added != -1:
-                    x_pool = np.append(x_pool, x_added)
-                if x_removed != -1:
-                    x_pool = x_pool[x_pool != x_removed]
-                tries += 1
-        if minDist < minDistGlobal:
-            minDistGlobal = minDist
-            x_sample_min = x_sample
-            y_sample_min = y_sample
-
-    return [x_sample_min, y_sample_min], minDistGlobal
-
-def E_extrema(D, model):
-    x = D['x'].reshape(-1, 1)
-    y = D['y']
-    y_predicted = model.predict(x)
-    return (y.max() - y_predicted.max()) ** 2 + (y.min() - y_predicted.min()) ** 2
+                sample, _ = globals()[teacher](D, H, evaluator)
+                if len(sample[0]):
+                    offer(_sample_index(D, sample))
+    return dict(sorted(ladder.items()))
 
-def E_MSE_extrema(D, model):
-    x = D['x'].reshape(-1, 1)
-    y = D['y']
-    y_predicted = model.predict(x)
-    return E_MSE(D, model) + 10 * ((y.max() - y_predicted.max()) ** 2 + (y.min() - y_predicted.min()) ** 2)
\ No newline at end of file
+def pick_rung(ladder, k=None, distance=None):
+    if k is not None and distance is not None:
+        raise Exception("Pass k or distance, not both")
+    if k is not None:
+        return (k,) + tuple(ladder[k]) if k in ladder else None
+    if not ladder:
+        return None
+    if distance is not None:
+        for size, (index, d) in ladder.items():
+            if d <= distance:
+                return size, index, d
+    size = min(ladder, key=lambda size: ladder[size][1])
+    return (size,) + tuple(ladder[size])
+
+"""
+The sample of size k, or the smallest sample within `distance`, from the sample
+ladder of D up to size k, or K when k is not given. pipeline.run answers it from the
+precomputed ladders when the dataset has one.
+budget: seconds the exact teachers may take, as in T_Auto (the beam search
+        sweep is not bounded by it)
+info: optional dict, filled with the size and distance of the sample and
+      'source': 'online'.
+"""
+def T_Ladder(D, H, evaluator, k=None, distance=None, K=LADDER_K, budget=AUTO_BUDGET, info=None):
+    x = np.asarray(D['x']).reshape(-1)
+    y = np.asarray(D['y']).reshape(-1)
+    rung = pick_rung(sample_ladder(D, H, evaluator, K if k is None else k, budget), k, distance)
+    if rung is None:
+        if k is not None:
+            raise Exception("Invalid sample size")
+        return [[],[]], math.inf
+    size, index, minDist = rung
+    if info is not None:
+        info.update({'k': size, 'distance': minDist, 'source': 'online'})
+    return [x[index], y[index]], minDist
@@ -0,0 +1,101 @@
+"""
+Load test for a running server (python serve.py or python hello.py).
+
+    python loadtest.py [--url http://127.0.0.1:5000] [--requests 500] [--concurrency 8]
+                       [--data all] [-H H_PL7] [-T T_PL7] [-E E_MSE] [--params 'format=base64&omit=x']
+
+Sends GET /pipeline requests from --concurrency client threads, each over its own
+keep-alive connection, cycling through every dataset x human x teacher x
+evaluator given (every registered dataset by default). Reports throughput, the
+latency percentiles and the count of each status. Results are cached by the
+server, so after the first round this measures serving, not teaching; restart
+the server with an empty storage/cache to time the teachers too.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+def registered(path='datasets.json'):
+    with open(path) as f:
+        return [d['true_values'] for d in json.load(f)['datasets']]
+
+def paths(args):
+    datasets = registered() if args.data == ['all'] else args.data
+    extra = '&' + args.params if args.params else ''
+    return ['/pipeline?' + urlencode({'data': d, 'h': h, 't': t, 'e': e}) + extra
+            for d, h, t, e in itertools.product(datasets, args.humans, args.teachers, args.evaluators)]
+
+def run(url, targets, requests, concurrency, timeout=120):
+    split = urlsplit(url)
+    order = itertools.count()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(split.hostname, split.port or 80, timeout=timeout)
+        while True:
+            i = next(order)
+            if i >= requests:
+                break
+            start = time.perf_counter()
+            try:
+                connection.request('GET', targets[i % len(targets)], headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+                connection.close()
+                connection = http.client.HTTPConnection(split.hostname, split.port or 80, timeout=timeout)
+            seconds = time.perf_counter() - start
+            with lock:
+                latencies.append(seconds)
+                statuses[status] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {'requests': len(latencies), 'seconds': elapsed, 'throughput': len(latencies) / elapsed,
+            'p50_ms': float(np.percentile(ms, 50)), 'p90_ms': float(np.percentile(ms, 90)),
+            'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max()),
+            'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)}}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--data', nargs='+', default=['all'])
+    parser.add_argument('-H', '--humans', nargs='+', default=['H_PL7'])
+    parser.add_argument('-T', '--teachers', nargs='+', default=['T_PL7'])
+    parser.add_argument('-E', '--evaluators', nargs='+', default=['E_MSE'])
+    parser.add_argument('--params', default='', help='extra query string, e.g. format=base64&omit=x')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    report = run(args.url, paths(args), args.requests, args.concurrency)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print('%d requests in %.2fs: %.1f req/s' % (report['requests'], report['seconds'], report['throughput']))
+        print('latency p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms' %
+              (report['p50_ms'], report['p90_ms'], report['p99_ms'], report['max_ms']))
+        print('status', ' '.join('%s:%d' % kv for kv in report['statuses'].items()))
+    return 0 if set(report['statuses']) == {'200'} else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
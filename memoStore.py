@@ -0,0 +1,47 @@
+"""
+On-disk memo store for teacher intermediate state (e.g. the T_PL dynamic
+programming tables).
+
+Entries are .npy files keyed by a hash of the data they were computed from, the
+kind of table and its parameters (sample size, objective, evaluator), plus
+MEMO_VERSION, so a table is never reused for other data, another size or an
+older layout. Writes are atomic, reads are memory-mapped so large tables are
+paged in on demand, and the directory is capped at MEMO_BYTES with least
+recently used eviction. Entries may disappear at any time; callers recompute
+on a miss.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from resultCache import DiskCache
+
+MEMO_VERSION = 1
+MEMO_DIR = os.path.join('storage', 'memo')
+MEMO_BYTES = 512 << 20
+
+def array_digest(*arrays):
+    h = hashlib.sha256()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def memo_key(kind, digest, **params):
+    spec = json.dumps([MEMO_VERSION, kind, digest, params], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+class MemoStore(DiskCache):
+    suffix = '.npy'
+
+    def __init__(self, directory=MEMO_DIR, max_bytes=MEMO_BYTES):
+        super().__init__(directory, max_bytes)
+
+    def load(self, path):
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+
+    def dump(self, f, value):
+        np.save(f, np.asarray(value), allow_pickle=False)
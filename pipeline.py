@@ -1,44 +1,234 @@
-import pandas as pd
 from legoBlocks import *
+import contextvars
 import json
+import inspect
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from resultCache import ResultCache, result_key
+from profiler import profile_scope, section
+from datasetRegistry import DatasetRegistry
+from ladderIndex import LadderIndex
+from resultEncoding import compact, dumps, encode, loads
 
 humans = ['H_OLS', 'H_quad', 'H_PL7']
-teachers = ['T_OLS2', 'T_quad3', 'T_PL7', 'T_GreedyConstruction', 'T_HillClimbingRestart']
+teachers = ['T_OLS2', 'T_quad3', 'T_quad3Shortlist', 'T_PL7', 'T_GreedyConstruction', 'T_HillClimbingRestart', 'T_DouglasPeucker', 'T_Auto', 'T_Pyramid', 'T_BeamSearch', 'T_Ladder']
 evaluators = ['E_MSE', 'E_extrema', 'E_MSE_extrema']
 
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        return json.JSONEncoder.default(self, obj)
-
-def run(filename, human, teacher, evaluator):
-	f = os.path.join('data', filename)
-	if os.path.isfile(f) and f.endswith('.csv'):
-		d = pd.read_csv(f)
-		D = {}
-		# D['x'] = ((d.iloc[:, 0] - d.iloc[:, 0].min()) / (d.iloc[:, 0].max() - d.iloc[:, 0].min())).to_numpy()
-		# D['y'] = ((d.iloc[:, 1] - d.iloc[:, 1].min()) / (d.iloc[:, 1].max() - d.iloc[:, 1].min())).to_numpy()
-		D['x'] = d.iloc[:,0].to_numpy()
-		D['y'] = d.iloc[:,1].to_numpy()
-		D['name'] = filename
-	else:
-		raise Exception("Invalid filename")
+cache = ResultCache()
+registry = DatasetRegistry()
+ladders = LadderIndex()
+
+# series are parsed once and memory-mapped (see datasetRegistry.py); the arrays are read-only
+def load(filename):
+	return registry.load(filename)
 
+def build(human, teacher, evaluator, params=None):
 	if (human in humans) and (teacher in teachers) and (evaluator in evaluators):
-		pipeline_code = f"Pipeline(human_proxy={human}, teacher={teacher}, evaluator={evaluator})"
-		pipeline = eval(pipeline_code)
-		sample, _ = pipeline.generate_sample(D)
-		model_sample = pipeline.H(sample[0], sample[1])
-		y_learned_from_sample = model_sample.predict(D['x'].reshape(-1, 1))   
-		score = pipeline.getScore(D, sample)
-		json_dump = json.dumps({'sample': sample, 'score': score, 'x': D['x'], 'prediction': y_learned_from_sample}, 
-                       cls=NumpyEncoder)
-		return json_dump
+		params = params or {}
+		if not set(params) <= set(inspect.signature(eval(teacher)).parameters) - {'D', 'H', 'evaluator', 'info', 'ladder'}:
+			raise Exception("Invalid teacher parameter")
+		pipeline_code = f"Pipeline(human_proxy={human}, teacher={teacher}, evaluator={evaluator}, **params)"
+		return eval(pipeline_code)
 	else:
 		raise Exception("Invalid pipeline component")
 
+def cache_key(filename, human, teacher, evaluator, params=None):
+	return result_key(registry.digest(filename), human, teacher, evaluator, params)
+
+# teachers with an `info` parameter (T_Auto, T_Pyramid, T_Ladder) say how they got the sample; it is returned as the result's 'info'
+def generate(pipeline, D):
+	if 'info' not in inspect.signature(pipeline.T).parameters:
+		return pipeline.generate_sample(D)[0], None
+	info = {}
+	sample, _ = pipeline.generate_sample(D, info=info)
+	return sample, info
+
+def result(pipeline, D, sample, score=None, info=None):
+	model_sample = pipeline.H(sample[0], sample[1])
+	y_learned_from_sample = model_sample.predict(D['x'].reshape(-1, 1))
+	if score is None:
+		score = pipeline.getScore(D, sample)
+	body = {'sample': sample, 'score': score, 'x': D['x'], 'prediction': y_learned_from_sample}
+	if info is not None:
+		body['info'] = info
+	return body
+
+def serialize(pipeline, D, sample, score=None, info=None):
+	return dumps(result(pipeline, D, sample, score, info))
+
+# T_Ladder from the precomputed ladders (see ladderIndex.py): the result JSON, or None to compute it.
+# Checked before the result cache, so ladders built after an online answer was cached take over.
+def lookup(filename, human, teacher, evaluator, params=None, D=None):
+	params = params or {}
+	if teacher != 'T_Ladder' or not set(params) <= {'k', 'distance', 'budget'}:
+		return None
+	pipeline = build(human, teacher, evaluator, params)
+	rung = ladders.get(registry.digest(filename), human, evaluator, params.get('k'), params.get('distance'))
+	if rung is None:
+		return None
+	if D is None:
+		D = load(filename)
+	k, index, distance = rung
+	x = np.asarray(D['x']).reshape(-1)
+	y = np.asarray(D['y']).reshape(-1)
+	return serialize(pipeline, D, [x[index], y[index]], distance, {'k': k, 'distance': distance, 'source': 'index'})
+
+# D: the loaded dataset, when the caller already has it
+def run(filename, human, teacher, evaluator, params=None, use_cache=True, D=None):
+	indexed = lookup(filename, human, teacher, evaluator, params, D)
+	if indexed is not None:
+		return indexed
+	key = cache_key(filename, human, teacher, evaluator, params)
+	if use_cache:
+		cached = cache.get(key)
+		if cached is not None:
+			return cached
+	if D is None:
+		D = load(filename)
+	pipeline = build(human, teacher, evaluator, params)
+	sample, info = generate(pipeline, D)
+	json_dump = serialize(pipeline, D, sample, info=info)
+	if use_cache:
+		cache.put(key, json_dump)
+	return json_dump
+
+"""
+The result of run() for the wire (see resultEncoding.py): omit drops fields such
+as 'x', pixels quantizes the prediction to that many steps over the range of y,
+fmt is 'json', 'base64' or 'msgpack'. Returns (bytes, mimetype).
+"""
+def run_encoded(filename, human, teacher, evaluator, params=None, fmt='json', omit=(), pixels=None):
+	json_dump = run(filename, human, teacher, evaluator, params)
+	if fmt == 'json' and not omit and not pixels:
+		return json_dump.encode(), 'application/json'
+	y_range = None
+	if pixels:
+		y = load(filename)['y']
+		y_range = (y.min(), y.max())
+	return encode(compact(loads(json_dump), y_range, omit, pixels), fmt)
+
+"""
+Runs the pipeline instrumented (see profiler.py), bypassing the cache. Returns the
+result JSON with an extra 'profile' field (per-component counts and seconds, and
+the collapsed stacks) and the Profile itself, e.g. for Profile.write_collapsed().
+"""
+def run_profiled(filename, human, teacher, evaluator, params=None):
+	with profile_scope() as profile:
+		with section('load'):
+			D = load(filename)
+		pipeline = build(human, teacher, evaluator, params)
+		sample, info = generate(pipeline, D)
+		with section('result'):
+			body = result(pipeline, D, sample, info=info)
+	body['profile'] = dict(profile.summary(), collapsed=profile.collapsed())
+	return dumps(body), profile
+
+"""
+Streams a run as (event, JSON) pairs: an 'update' result (same fields as run)
+each time the teacher's incumbent improves, then the final 'done' result.
+Closing the generator stops the teacher. A precomputed (see lookup) or cached
+result is sent as 'done' only.
+"""
+def run_stream(filename, human, teacher, evaluator, params=None, use_cache=True):
+	indexed = lookup(filename, human, teacher, evaluator, params)
+	if indexed is not None:
+		yield 'done', indexed
+		return
+	key = cache_key(filename, human, teacher, evaluator, params)
+	cached = cache.get(key) if use_cache else None
+	if cached is not None:
+		yield 'done', cached
+		return
+	# prepared once, as Pipeline.generate_sample does, so evaluator calls do not redo it
+	D = prepare(load(filename))
+	pipeline = build(human, teacher, evaluator, params)
+	# as in generate(), a teacher with an `info` parameter fills it for the final result
+	info = {} if 'info' in inspect.signature(pipeline.T).parameters else None
+	options = dict(pipeline.params, info=info) if info is not None else pipeline.params
+	updates = anytime_events(pipeline.T, D, pipeline.H, pipeline.E, **options)
+	try:
+		final = None
+		for kind, (sample, distance) in updates:
+			if kind == 'done':
+				# sent once, as 'done', scored by the evaluator (not the teacher's own objective)
+				final = sample
+			else:
+				yield 'update', serialize(pipeline, D, sample, distance)
+	finally:
+		updates.close()
+	json_dump = serialize(pipeline, D, final, info=info)
+	if use_cache:
+		cache.put(key, json_dump)
+	yield 'done', json_dump
+
+BATCH_WORKERS = 4
+
+"""
+Runs many configurations in one call. configs: dicts with 'data', 'h', 't', 'e'
+and optional 'params'. Yields one JSON line per finished run, in completion order:
+  {"event": "result", "index": i, "result": <same as run>}
+  {"event": "error", "index": i, "error": "..."}
+and, once per (dataset, human) pair, the prediction of the human fitted to all
+of the dataset, for the comparison curve:
+  {"event": "raw", "data": ..., "h": ..., "prediction": [...]}
+Each dataset is loaded once and each full-data fit computed once, however many
+teachers and evaluators use them. Runs share a pool of `workers` threads.
+Closing the generator cancels the runs still going at their next progress report.
+"""
+def run_batch(configs, workers=BATCH_WORKERS, use_cache=True):
+	shared = {}
+	lock = threading.Lock()
+	stop = threading.Event()
+
+	def once(key, compute):
+		with lock:
+			future = shared.get(key)
+			owner = future is None
+			if owner:
+				future = shared[key] = Future()
+		if owner:
+			try:
+				future.set_result(compute())
+			except Exception as e:
+				future.set_exception(e)
+		return future.result()
+
+	def check(**_):
+		if stop.is_set():
+			raise Cancelled()
+
+	def raw(filename, human):
+		D = once(('load', filename), lambda: load(filename))
+		model_raw = eval(human)(D['x'].reshape(-1, 1), D['y'])
+		prediction = model_raw.predict(D['x'].reshape(-1, 1))
+		return dumps({'event': 'raw', 'data': filename, 'h': human, 'prediction': prediction})
+
+	def task(index, config):
+		filename, human = config.get('data'), config.get('h')
+		with progress_scope(check):
+			D = once(('load', filename), lambda: load(filename))
+			body = run(filename, human, config.get('t'), config.get('e'), config.get('params'), use_cache, D)
+		lines = ['{"event": "result", "index": %d, "result": %s}' % (index, body)]
+		try:
+			line = once(('raw', filename, human), lambda: raw(filename, human))
+		except Exception:
+			return lines
+		with lock:
+			first = ('sent', filename, human) not in shared
+			shared[('sent', filename, human)] = True
+		if first:
+			lines.append(line)
+		return lines
+
+	executor = ThreadPoolExecutor(max_workers=max(1, workers))
+	try:
+		# tasks run in the caller's context, so its deadline_scope applies to them
+		futures = {executor.submit(contextvars.copy_context().run, task, i, config): i for i, config in enumerate(configs)}
+		for future in as_completed(futures):
+			try:
+				yield from future.result()
+			except Exception as e:
+				yield json.dumps({'event': 'error', 'index': futures[future], 'error': str(e)})
+	finally:
+		stop.set()
+		executor.shutdown(wait=False, cancel_futures=True)
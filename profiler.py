@@ -0,0 +1,174 @@
+"""
+Opt-in instrumentation of pipeline runs.
+
+Inside profile_scope(), Pipeline.generate_sample hands the teacher wrapped
+versions of its human proxy and evaluator, so every H(x, y) construction (which
+includes the fit), every predict and every evaluator call is counted and timed,
+nested under the teacher. Teachers mark their own bookkeeping (SampleBuffer
+moves, T_Pyramid's coarse solve) with section(). Outside a scope section() returns a shared no-op
+context after one context variable lookup and nothing is wrapped.
+
+A Profile keeps count and inclusive time per call path. summary() folds the paths
+into per-component totals; collapsed() renders them as collapsed stacks
+("Pipeline;T_PL7;E_MSE 1234", self time in microseconds) for flamegraph.pl,
+speedscope or inferno. Work done in worker processes (T_HillClimbingRestart with
+workers > 1) is not recorded.
+"""
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+_profile = contextvars.ContextVar('profile', default=None)
+_NULL = nullcontext()
+
+class Profile:
+    def __init__(self, root='Pipeline'):
+        self.stats = defaultdict(lambda: [0, 0.0])  # call path -> [count, inclusive seconds]
+        self.path = (root,)
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    @contextmanager
+    def section(self, name):
+        parent = self.path
+        self.path = parent + (name,)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stat = self.stats[self.path]
+            stat[0] += 1
+            stat[1] += time.perf_counter() - start
+            self.path = parent
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def _self_seconds(self):
+        own = {path: stat[1] for path, stat in self.stats.items()}
+        for path, stat in self.stats.items():
+            if path[:-1] in own:
+                own[path[:-1]] -= stat[1]
+        root = (self.path[0],)
+        total = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        own[root] = total - sum(stat[1] for path, stat in self.stats.items() if len(path) == 2)
+        return own
+
+    def summary(self):
+        components = {}
+        for path, seconds in self._self_seconds().items():
+            count, inclusive = self.stats[path] if path in self.stats else (1, seconds)
+            c = components.setdefault(path[-1], {'count': 0, 'seconds': 0.0, 'self_seconds': 0.0})
+            c['count'] += count
+            c['seconds'] += inclusive
+            c['self_seconds'] += seconds
+        return {'seconds': self.seconds, 'components': components}
+
+    def collapsed(self):
+        return ['%s %d' % (';'.join(path), max(0, round(seconds * 1e6)))
+                for path, seconds in sorted(self._self_seconds().items())]
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
+
+@contextmanager
+def profile_scope(profile=None):
+    profile = profile if profile is not None else Profile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+        profile.stop()
+
+def profiling():
+    return _profile.get() is not None
+
+def section(name):
+    profile = _profile.get()
+    return _NULL if profile is None else profile.section(name)
+
+def _name(obj):
+    return getattr(obj, '__name__', type(obj).__name__)
+
+class ProfiledModel:
+    def __init__(self, model, name):
+        self.model = model
+        self.name = name + '.predict'
+        if hasattr(model, 'deviation'):
+            self.deviation = model.deviation
+
+    def predict(self, x):
+        with section(self.name):
+            return self.model.predict(x)
+
+class ProfiledIncrementalState:
+    def __init__(self, state, name):
+        self.state = state
+        self.name = name
+
+    def score(self, X, y):
+        with section(self.name + '.score'):
+            return self.state.score(X, y)
+
+    def commit(self, X, y):
+        with section(self.name + '.commit'):
+            return self.state.commit(X, y)
+
+class ProfiledHuman:
+    """
+    Stands in for a human proxy class: H(x, y) is timed as a construction and
+    returns a model whose predict is timed too.
+    """
+    def __init__(self, H):
+        self.H = H
+        self.__name__ = _name(H)
+        if hasattr(H, 'incremental'):
+            self.incremental = self._incremental
+        if hasattr(H, 'window'):
+            self.window = H.window
+        if hasattr(H, 'batch_predict'):
+            self.batch_predict = self._batch_predict
+
+    def __call__(self, x, y):
+        with section(self.__name__):
+            model = self.H(x, y)
+        return ProfiledModel(model, self.__name__)
+
+    def _incremental(self, D, evaluator):
+        with section(self.__name__ + '.incremental'):
+            state = self.H.incremental(D, evaluator)
+        return ProfiledIncrementalState(state, self.__name__)
+
+    def _batch_predict(self, X, Y, x):
+        with section(self.__name__ + '.batch_predict'):
+            return self.H.batch_predict(X, Y, x)
+
+class ProfiledEvaluator:
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.__name__ = _name(evaluator)
+        if hasattr(evaluator, 'incremental'):
+            self.incremental = self._incremental
+        if hasattr(evaluator, 'coarse'):
+            self.coarse = self._coarse
+        if hasattr(evaluator, 'batch'):
+            self.batch = self._batch
+
+    def __call__(self, D, model):
+        with section(self.__name__):
+            return self.evaluator(D, model)
+
+    def _incremental(self, D, stats):
+        with section(self.__name__ + '.incremental'):
+            return self.evaluator.incremental(D, stats)
+
+    def _coarse(self, D, stats):
+        with section(self.__name__ + '.coarse'):
+            return self.evaluator.coarse(D, stats)
+
+    def _batch(self, D, predicted):
+        with section(self.__name__ + '.batch'):
+            return self.evaluator.batch(D, predicted)
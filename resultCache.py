@@ -0,0 +1,160 @@
+"""
+Cache of serialized pipeline results.
+
+Results are keyed by a hash of the dataset file's contents plus the names of the
+human, teacher and evaluator and the teacher parameters, so editing the CSV
+invalidates its entries without any bookkeeping. The key also holds
+RESULT_VERSION: bump it when a change to the teachers, humans, evaluators or the
+result's fields changes what a run returns, so entries on disk do not outlive
+the deploy that changes them. Lookups go to an in-memory LRU first and then to
+one file per entry under CACHE_DIR, which is trimmed back to DISK_BYTES by
+evicting the least recently used files.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+RESULT_VERSION = 2
+CACHE_DIR = os.path.join('storage', 'cache')
+MEMORY_ENTRIES = 256
+DISK_BYTES = 256 << 20
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+def file_digest(path):
+    # sha256 of the file, recomputed only when its size or mtime changes
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+def result_key(digest, human, teacher, evaluator, params=None):
+    spec = json.dumps([RESULT_VERSION, digest, human, teacher, evaluator, params or {}], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+class LRUCache:
+    def __init__(self, max_entries=MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class DiskCache:
+    """
+    One file per key. Writes go through a temporary file and os.replace, so a
+    reader never sees a partial entry. Reads refresh the file's mtime, which is
+    the recency eviction goes by. Eviction holds an exclusive lock on a lock file
+    in the directory so concurrent workers do not trim the same entries twice.
+    Subclasses store other values by overriding load() and dump().
+    """
+    suffix = '.json'
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DISK_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def dump(self, f, value):
+        f.write(value)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            value = self.load(path)
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.dump(f, value)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class ResultCache:
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk if disk is not None else DiskCache()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            data = self.disk.get(key)
+            if data is not None:
+                value = data.decode()
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        self.disk.put(key, value.encode())
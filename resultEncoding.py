@@ -0,0 +1,126 @@
+"""
+Encodings for pipeline results.
+
+dumps() is the JSON serializer results go through: orjson when it is installed,
+which writes NumPy arrays directly, else json with NumpyEncoder, which goes
+through .tolist(). compact() trims a result for the wire: it drops echoed inputs
+(x is what /data/<filename> already sent) and quantizes the prediction to the
+chart's pixel rows. encode() then writes it as
+  'json'     plain JSON
+  'base64'   JSON with every array as {"dtype", "shape", "base64"} of its raw
+             little-endian bytes (float32 for floats); 'sample' becomes two
+             flat arrays, x and y
+  'msgpack'  MessagePack with the same arrays as bin (needs msgpack installed)
+and compress() applies brotli (when installed) or gzip as the client accepts.
+
+orjson, msgpack and brotli are optional dependencies, installed from PyPI as
+usual (pip install orjson msgpack brotli); without them results go through json,
+'msgpack' is refused and responses are gzipped.
+"""
+import base64
+import gzip
+import json
+
+import numpy as np
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ('json', 'base64', 'msgpack')
+MIMETYPES = {'json': 'application/json', 'base64': 'application/json', 'msgpack': 'application/msgpack'}
+ARRAY_FIELDS = ('sample', 'x', 'prediction')
+COMPRESS_MIN = 1024
+
+class NumpyEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        elif isinstance(obj, np.integer):
+            return int(obj)
+        elif isinstance(obj, np.floating):
+            return float(obj)
+        return json.JSONEncoder.default(self, obj)
+
+def _default(obj):
+    # what orjson cannot write itself: non-contiguous or odd-dtype arrays
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(type(obj).__name__)
+
+def dumps(body):
+    if orjson is not None:
+        return orjson.dumps(body, default=_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(body, cls=NumpyEncoder)
+
+def loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def compact(body, y_range=None, omit=(), pixels=None):
+    """
+    omit: fields to drop, e.g. ('x',)
+    pixels: quantize the prediction to this many steps over y_range (lo, hi); it
+            becomes integers q with prediction = offset + q * step, and
+            'prediction_scale' = {"offset", "step"} is added
+    """
+    body = {k: v for k, v in body.items() if k not in omit}
+    if pixels and 'prediction' in body:
+        lo, hi = y_range
+        step = (hi - lo) / pixels or 1.0
+        q = np.rint((np.asarray(body['prediction'], dtype=float) - lo) / step)
+        body['prediction'] = q.astype(np.int32 if np.abs(q).max(initial=0) > 32767 else np.int16)
+        body['prediction_scale'] = {'offset': float(lo), 'step': float(step)}
+    return body
+
+def _packed(a):
+    a = np.asarray(a)
+    if a.dtype.kind == 'f':
+        a = a.astype('<f4')
+    elif a.dtype.kind in 'iu':
+        a = a.astype(a.dtype.newbyteorder('<'))
+    return a
+
+def encode(body, fmt='json'):
+    # returns (bytes, mimetype)
+    if fmt == 'json':
+        return dumps(body).encode(), MIMETYPES[fmt]
+    if fmt not in FORMATS:
+        raise Exception("Invalid format")
+    if fmt == 'msgpack' and msgpack is None:
+        raise Exception("msgpack is not installed")
+    def pack(a):
+        a = _packed(a)
+        if fmt == 'base64':
+            return {'dtype': a.dtype.str, 'shape': a.shape, 'base64': base64.b64encode(a.tobytes()).decode()}
+        return {'dtype': a.dtype.str, 'shape': a.shape, 'data': a.tobytes()}
+
+    body = dict(body)
+    for k in ARRAY_FIELDS:
+        if k == 'sample' and k in body:
+            body[k] = [pack(np.ravel(np.asarray(part, dtype=float))) for part in body[k]]
+        elif k in body:
+            body[k] = pack(body[k])
+    if fmt == 'base64':
+        return dumps(body).encode(), MIMETYPES[fmt]
+    return msgpack.packb(body, default=_default), MIMETYPES[fmt]
+
+def compress(data, accept_encoding=''):
+    # returns (data, Content-Encoding or None)
+    if len(data) < COMPRESS_MIN:
+        return data, None
+    accepted = {token.split(';')[0].strip() for token in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(data, quality=5), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(data, compresslevel=5), 'gzip'
+    return data, None
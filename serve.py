@@ -0,0 +1,188 @@
+"""
+Production entry point: a pre-forking server for the app in hello.py.
+
+    python serve.py [--host 127.0.0.1] [--port 5000] [--workers 4] [--concurrency 2] [--timeout 60]
+                    [--queue-timeout 10] [--quiet]
+
+The parent imports the app (legoBlocks, pipeline, ...), reads datasets.json,
+parses or maps every registered series (see datasetRegistry.py), reads the
+precomputed sample ladders (ladderIndex.py), binds the listening socket and then
+forks the workers, which inherit all of it: module state is shared copy-on-write
+(the garbage collector is frozen first so it does not touch, and so copy, those
+pages) and the series are file-backed memory maps shared through the page cache.
+Each worker runs a threaded WSGI server on the shared socket and the kernel
+spreads connections over them. A worker that dies is replaced; SIGTERM or SIGINT
+stops them all.
+
+In each worker, requests to the pipeline routes (PIPELINE_ROUTES) are limited to
+--concurrency at a time; a request that waits longer than --queue-timeout for a
+slot gets 503. A running request gets --timeout seconds: past that, the
+teacher's next progress report raises Cancelled ('Timed out'), which /pipeline
+answers with 504 and the streaming routes end with an error event or line. A
+batch holds one slot, so its threads are capped at --concurrency too, as are
+the processes a request's `workers` parameter starts. Other routes (pages, data
+files, jobs) are not limited. A job is kept by the process that accepted it and
+a poll could reach another worker, so with more than one worker the job routes
+answer 501; run --workers 1 to use them.
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from legoBlocks import deadline_scope
+
+WORKERS = os.cpu_count() or 1
+CONCURRENCY = 2
+TIMEOUT = 60.0
+QUEUE_TIMEOUT = 10.0
+PIPELINE_ROUTES = ('/pipeline',)  # and /pipeline/stream, /pipeline/batch
+
+class _Body:
+    # the response iterable, iterated inside the request's deadline; releases the slot when closed
+    def __init__(self, body, deadline, release):
+        self.body = body
+        self.iterator = iter(body)
+        self.deadline = deadline
+        self.release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with deadline_scope(self.deadline):
+            return next(self.iterator)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.release()
+
+class Limits:
+    """
+    WSGI middleware bounding the pipeline routes: at most `concurrency` at once,
+    each within `timeout` seconds, waiting at most `queue_timeout` for a slot.
+    """
+    def __init__(self, app, concurrency=CONCURRENCY, timeout=TIMEOUT, queue_timeout=QUEUE_TIMEOUT):
+        self.app = app
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith(PIPELINE_ROUTES):
+            return self.app(environ, start_response)
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'), ('Retry-After', '1')])
+            return [json.dumps({'error': 'Server busy'}).encode()]
+        released = threading.Event()
+        def release():
+            if not released.is_set():
+                released.set()
+                self.slots.release()
+        deadline = time.monotonic() + self.timeout
+        try:
+            with deadline_scope(deadline):
+                body = self.app(environ, start_response)
+        except BaseException:
+            release()
+            raise
+        return _Body(body, deadline, release)
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+def load_app(concurrency, timeout, queue_timeout, jobs=True):
+    import hello
+    import pipeline
+    hello.BATCH_MAX_WORKERS = min(hello.BATCH_MAX_WORKERS, concurrency)
+    hello.MAX_PROCESSES = min(hello.MAX_PROCESSES, concurrency)
+    if not jobs:
+        hello.jobManager = None
+    pipeline.registry.preload()
+    pipeline.ladders.preload()
+    return Limits(hello.app, concurrency, timeout, queue_timeout)
+
+def worker(app, sock, quiet):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno(),
+                         request_handler=QuietHandler if quiet else None)
+    server.serve_forever()
+
+def serve(host='127.0.0.1', port=5000, workers=WORKERS, concurrency=CONCURRENCY, timeout=TIMEOUT,
+          queue_timeout=QUEUE_TIMEOUT, quiet=False):
+    forking = hasattr(os, 'fork') and workers > 1
+    app = load_app(concurrency, timeout, queue_timeout, jobs=not forking)
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+    print('serving on http://%s:%d with %d worker(s)' % (host, sock.getsockname()[1], workers), flush=True)
+    if not hasattr(os, 'fork'):
+        worker(app, sock, quiet)
+        return
+
+    gc.collect()
+    gc.freeze()
+    children = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker(app, sock, quiet)
+            finally:
+                os._exit(1)
+        children.add(pid)
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print('worker %d exited (status %d), restarting' % (pid, status), file=sys.stderr, flush=True)
+            time.sleep(0.1)
+            spawn()
+    sock.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='pipeline requests per worker at once')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='seconds a pipeline request may run')
+    parser.add_argument('--queue-timeout', type=float, default=QUEUE_TIMEOUT, help='seconds to wait for a free slot')
+    parser.add_argument('--quiet', action='store_true', help='no access log')
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.concurrency, args.timeout, args.queue_timeout, args.quiet)
+
+if __name__ == '__main__':
+    main()
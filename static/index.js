@@ -144,41 +144,60 @@ function onEvaluatorClick(event, id) {
   evaluatorIndex = id
 }
 
+var pipelineEvents = null;
+
+// streams improving samples from the teacher; the chart is redrawn on every update
 function runPipeline() {
-  const http_request = new XMLHttpRequest();
-  const url="pipeline?data="+datasets[dataIndex].true_values+"&h="+humans[humanIndex]+"&t="+teachers[teacherIndex]+"&e="+evaluators[evaluatorIndex];
-  http_request.open("GET", url);
-  http_request.send();
-
-  http_request.onreadystatechange = function(){
-    if(http_request.readyState == 4){
-      var jsonObj = JSON.parse(http_request.responseText);
-      var sample = jsonObj['sample']
-      var score = jsonObj['score']
-      var x = jsonObj['x']
-      var prediction = jsonObj['prediction']
-      // console.log(sample)
-      // console.log(score)
-      var prediction_data = x.map(function(d, i) {
-        return [d, prediction[i]];
-      });
-      chart.draw_prediction(prediction_data)
-
-      console.log(sample)
-      sample = sample[0].map(function (x, i) { return [x, sample[1][i]]; });
-      console.log(sample)
-      chart.draw_sample(sample)
-      
-      console.log(prediction_data)
-
-      d3.select("#score").text("score = " + score)
-      document.getElementById('feedbackDiv').style.display = "block"
-      d3.select("#next").attr("disabled", true);
+  stopPipeline();
+  const url="pipeline/stream?data="+datasets[dataIndex].true_values+"&h="+humans[humanIndex]+"&t="+teachers[teacherIndex]+"&e="+evaluators[evaluatorIndex];
+  var first = true;
+  pipelineEvents = new EventSource(url);
+  d3.select("#next").attr("disabled", true);
+  d3.select("#stop").attr("disabled", null);
+
+  function draw(event) {
+    var jsonObj = JSON.parse(event.data);
+    var sample = jsonObj['sample']
+    var score = jsonObj['score']
+    var x = jsonObj['x']
+    var prediction = jsonObj['prediction']
+    var prediction_data = x.map(function(d, i) {
+      return [d, prediction[i]];
+    });
+    chart.draw_prediction(prediction_data, first)
+    first = false
+
+    sample = sample[0].map(function (x, i) { return [x, sample[1][i]]; });
+    chart.draw_sample(sample)
+
+    d3.select("#score").text("score = " + score)
+    document.getElementById('feedbackDiv').style.display = "block"
+  }
+
+  pipelineEvents.addEventListener("update", draw);
+  pipelineEvents.addEventListener("done", function(event) {
+    draw(event);
+    stopPipeline();
+  });
+  pipelineEvents.addEventListener("error", function(event) {
+    if (event.data) {
+      d3.select("#score").text(JSON.parse(event.data)['error'])
     }
+    stopPipeline();
+  });
+}
+
+// closing the stream also stops the teacher on the server
+function stopPipeline() {
+  if (pipelineEvents) {
+    pipelineEvents.close();
+    pipelineEvents = null;
   }
+  d3.select("#stop").attr("disabled", true);
 }
 
 function onResetClick() {
+  stopPipeline();
   d3.select("#next").attr("disabled", null);
   d3.select("svg").selectAll("*").remove();
   make_experiment(datasets[dataIndex])
@@ -250,6 +250,9 @@ d3.line_ev = function (true_values, aggregate_values, dataset, options) {
         .y(function(d) { return y(d[1]) })
         )
 
+    if (animate === false) {
+      return;
+    }
     var totalLength = path.node().getTotalLength();
 
     path.attr("stroke-dasharray", totalLength + ' ' + totalLength)
@@ -260,9 +263,11 @@ d3.line_ev = function (true_values, aggregate_values, dataset, options) {
         .attr('stroke-dashoffset', 0);
   };
 
-  line_ev.draw_prediction = function(data) {
+  line_ev.draw_prediction = function(data, animate) {
+    svg.selectAll(".prediction").remove();
     var path = svg.append("path")
       .datum(data)
+      .attr("class", "prediction")
       .attr("fill", "none")
       .attr("stroke", "orange")
       .attr("stroke-width", 2)
@@ -271,6 +276,9 @@ d3.line_ev = function (true_values, aggregate_values, dataset, options) {
         .y(function(d) { return y(d[1]) })
         )
 
+    if (animate === false) {
+      return;
+    }
     var totalLength = path.node().getTotalLength();
 
     path.attr("stroke-dasharray", totalLength + ' ' + totalLength)
@@ -282,10 +290,12 @@ d3.line_ev = function (true_values, aggregate_values, dataset, options) {
   };
 
   line_ev.draw_sample = function(data) {
+    svg.selectAll(".sample").remove();
     svg.selectAll("circles")
       .data(data)
       .enter()
       .append("circle")
+        .attr("class", "sample")
         .attr("fill", "red")
         .attr("stroke", "none")
         .attr("cx", function(d) { return x(d[0]) })